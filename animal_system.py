@@ -6,24 +6,20 @@ Bu modül hayvan fotoğraf ve bilgi API'lerini yönetir.
 Köpek, kedi, tilki, ördek için fotoğraf ve bilgi isteklerini işler.
 """
 
+import asyncio
 import httpx
+import orjson
 import re
-import html
 import os
+import time
+from collections import deque
+from functools import lru_cache, wraps
 from typing import Dict, Any
 
-# Güvenlik sabitleri
+from security import FILTERED_MESSAGE, sanitize
+
+# Güvenlik sabitleri (hayvan sistemi daha kısa mesaj kabul eder)
 MAX_ANIMAL_MESSAGE_LENGTH = 500
-DANGEROUS_ANIMAL_PATTERNS = [
-    r'<script[^>]*>.*?</script>',
-    r'javascript:',
-    r'data:text/html',
-    r'vbscript:',
-    r'on\w+\s*=',
-    r'<iframe[^>]*>',
-    r'<object[^>]*>',
-    r'<embed[^>]*>',
-]
 
 ANIMAL_FUNCTIONS_SPEC = [
     {
@@ -63,71 +59,195 @@ ANIMAL_SYSTEM_PROMPT = (
     "Seçenekler: dog_photo, dog_facts, cat_facts, cat_photo, fox_photo, duck_photo. "
     "Net hayvan isteği yoksa FONKSİYON ÇAĞIRMA ve normal akışa bırak."
 )
+# Sistem mesajı istek başına yeniden oluşturulmaz
+_ANIMAL_SYSTEM_MESSAGE = {"role": "system", "content": ANIMAL_SYSTEM_PROMPT}
 
+# Gemini fallback prompt şablonu (sadece kullanıcı mesajı yerleştirilir)
+_GEMINI_ANIMAL_PROMPT = """
+""" + ANIMAL_SYSTEM_PROMPT + """
+
+Kullanıcı mesajı: {user_message}
+
+Bu mesajda hangi hayvan API'sini çağırmam gerekiyor? Sadece şu seçeneklerden birini seç:
+- dog_photo: Köpek fotoğrafı
+- dog_facts: Köpek bilgisi  
+- cat_facts: Kedi bilgisi
+- cat_photo: Kedi fotoğrafı
+- fox_photo: Tilki fotoğrafı
+- duck_photo: Ördek fotoğrafı
+
+Sadece fonksiyon adını yazın, başka bir şey yazmayın.
+"""
 
-def _sanitize_animal_input(text: str) -> str:
-    """Hayvan sistemi için güvenli input sanitization"""
-    if not text:
-        return ""
-    
-    # HTML escape
-    text = html.escape(text, quote=True)
-    
-    # Tehlikeli pattern'leri kontrol et
-    for pattern in DANGEROUS_ANIMAL_PATTERNS:
-        if re.search(pattern, text, re.IGNORECASE):
-            print(f"[SECURITY] Hayvan sisteminde tehlikeli pattern: {pattern}")
-            return "[Güvenlik nedeniyle mesaj filtrelendi]"
-    
-    # Fazla boşlukları temizle
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
 
 def _validate_animal_message_length(text: str) -> bool:
     """Hayvan mesajı uzunluk kontrolü"""
     return len(text) <= MAX_ANIMAL_MESSAGE_LENGTH
 
-def _http_get_json(url: str) -> dict:
-    """HTTP GET isteği yapar ve JSON döndürür"""
-    with httpx.Client(timeout=15.0, follow_redirects=True) as s:
-        r = s.get(url)
+# Paylaşılan asenkron HTTP istemcisi: keep-alive bağlantıları tekrar kullanılır,
+# böylece her istekte yeni TCP+TLS el sıkışması yapılmaz
+# Bağlantı hataları (DNS, TCP/TLS kurulumu) transport katmanında yeniden denenir;
+# transport verildiğinde http2/limits ayarları client yerine transport'a geçer.
+HTTP_CONNECT_RETRIES = 3
+# 5xx ve okuma zaman aşımı için uygulama seviyesinde tek ek deneme ve bekleme süresi
+HTTP_RETRY_BACKOFF = 0.25
+
+_ACLIENT = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=HTTP_CONNECT_RETRIES,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0),
+    ),
+    timeout=15.0,
+    follow_redirects=True,
+)
+
+
+# Uygulama açılışında bağlantı havuzunu ısıtmak için kullanılan hayvan API'leri
+ANIMAL_HOSTS = (
+    "https://random.dog/",
+    "https://dog.ceo/",
+    "https://dogapi.dog/",
+    "https://meowfacts.herokuapp.com/",
+    "https://api.thecatapi.com/",
+    "https://randomfox.ca/",
+    "https://random-d.uk/",
+)
+
+
+async def warm_up_connections() -> None:
+    """Her hayvan API'sine hafif bir HEAD isteği atarak TCP/TLS bağlantılarını önceden açar"""
+    results = await asyncio.gather(*(_ACLIENT.head(url) for url in ANIMAL_HOSTS), return_exceptions=True)
+    warmed = sum(1 for r in results if not isinstance(r, Exception))
+    print(f"[ANIMAL] Bağlantı havuzu ısıtıldı: {warmed}/{len(ANIMAL_HOSTS)}")
+
+
+async def aclose_http_client() -> None:
+    """Paylaşılan HTTP istemcisini kapatır (uygulama kapanırken çağrılır)"""
+    await _ACLIENT.aclose()
+
+
+async def _a_get(url: str, **kwargs: Any) -> httpx.Response:
+    """GET isteği yapar; 5xx veya okuma zaman aşımında kısa beklemeyle bir kez daha dener"""
+    try:
+        r = await _ACLIENT.get(url, **kwargs)
+        if r.status_code < 500:
+            return r
+    except httpx.TimeoutException:
+        pass
+    await asyncio.sleep(HTTP_RETRY_BACKOFF)
+    r = await _ACLIENT.get(url, **kwargs)
+    r.raise_for_status()
+    return r
+
+
+async def _a_http_get_json(url: str) -> dict:
+    """Asenkron HTTP GET isteği yapar ve JSON döndürür"""
+    r = await _a_get(url)
+    r.raise_for_status()
+    return orjson.loads(r.content)
+
+
+# Fotoğraf API'leri yalnızca küçük bir JSON döndürür; beklenmedik büyük gövdeler
+# belleğe tamamen alınmadan kesilir
+PHOTO_JSON_MAX_BYTES = 16 * 1024
+
+
+async def _a_http_stream_json(url: str, max_bytes: int = PHOTO_JSON_MAX_BYTES) -> Any:
+    """GET yanıtını akış olarak okur; `max_bytes` aşılırsa indirmeyi keser ve hata verir"""
+    async with _ACLIENT.stream("GET", url) as r:
         r.raise_for_status()
-        return r.json()
+        body = bytearray()
+        async for chunk in r.aiter_bytes():
+            body += chunk
+            if len(body) > max_bytes:
+                raise ValueError(f"Yanıt çok büyük ({url}): {max_bytes} bayt sınırı aşıldı")
+    return orjson.loads(body)
+
+
+def _ttl_cache(seconds: float, field: str, ring_size: int = 1):
+    """Hayvan fonksiyonları için kısa süreli (TTL) yanıt önbelleği.
+
+    - Sonuç `seconds` süresince bellekten döner; upstream API'ye gidilmez
+    - `field` alanı boş olan sonuçlar (hata/yedek mesaj) önbelleğe alınmaz
+    - `ring_size` > 1 ise son sonuçlar halka tamponda tutulur ve pencere içinde
+      sırayla döndürülür; fotoğraflarda "rastgele" hissi korunur
+    """
+    def decorator(func):
+        ring: deque = deque(maxlen=ring_size)
+        state = {"fetched_at": 0.0, "index": 0}
+
+        @wraps(func)
+        async def wrapper() -> dict:
+            now = time.monotonic()
+            if ring and now - state["fetched_at"] < seconds:
+                state["index"] = (state["index"] + 1) % len(ring)
+                return dict(ring[state["index"]])
+            result = await func()
+            if result.get(field):
+                ring.append(result)
+                state["fetched_at"] = now
+                state["index"] = len(ring) - 1
+            return dict(result)
+
+        return wrapper
+    return decorator
+
+
+# Hayvan türü -> emoji (modül yüklenirken bir kez kurulur)
+ANIMAL_EMOJIS = {
+    "dog": "🐶",
+    "cat": "🐱",
+    "fox": "🦊",
+    "duck": "🦆",
+}
 
 
 def _animal_emoji(animal: str) -> str:
     """Hayvan türüne göre emoji döndürür"""
-    mapping = {
-        "dog": "🐶",
-        "cat": "🐱",
-        "fox": "🦊",
-        "duck": "🦆",
-    }
-    return mapping.get(animal, "🙂")
+    return ANIMAL_EMOJIS.get(animal, "🙂")
+
+
+# random.dog resim dışı dosya döndürürse kullanılan, her zaman resim veren yedek kaynak
+DOG_CEO_RANDOM_URL = "https://dog.ceo/api/breeds/image/random"
+_IMG_EXTS = frozenset({".jpg", ".jpeg", ".png", ".gif", ".webp"})
 
 
 def _is_image_url(url: str) -> bool:
     """URL'nin resim dosyası olup olmadığını kontrol eder"""
     if not url:
         return False
-    url_l = url.lower()
-    for ext in (".jpg", ".jpeg", ".png", ".gif", ".webp"):
-        if url_l.endswith(ext):
-            return True
-    return False
+    # Sorgu dizesini at (örn. ...jpg?width=500) ve uzantıya tek seferde bak
+    _, ext = os.path.splitext(url.lower().split("?", 1)[0])
+    return ext in _IMG_EXTS
 
 
-def dog_photo() -> dict:
+@_ttl_cache(seconds=5, field="image_url", ring_size=5)
+async def dog_photo() -> dict:
     """Köpek fotoğrafı getirir"""
-    # random.dog zaman zaman video döndürdüğü için birkaç deneme yap
+    # /woof düz metin olarak sadece dosya adını döndürür (JSON maliyeti yok);
+    # filter parametresi videoları sunucu tarafında eler, bu yüzden tek istek
+    # genellikle yeterlidir. Doğrulama başarısızsa random.dog tekrar denenmez;
+    # yalnızca resim döndüren dog.ceo'ya tek bir istek atılır.
     image_url = ""
-    for _ in range(6):
-        data = _http_get_json("https://random.dog/woof.json")
-        candidate = str(data.get("url", "")).strip()
+    try:
+        r = await _a_get(
+            "https://random.dog/woof",
+            params={"filter": "mp4,webm"},
+            headers={"Accept": "text/plain"},
+        )
+        r.raise_for_status()
+        filename = r.text.strip()
+        candidate = f"https://random.dog/{filename}" if filename else ""
         if _is_image_url(candidate):
             image_url = candidate
-            break
+    except Exception as e:
+        print(f"[ANIMAL] random.dog başarısız, dog.ceo deneniyor: {e}")
+    if not image_url:
+        data = await _a_http_stream_json(DOG_CEO_RANDOM_URL)
+        candidate = str(data.get("message", "")) if data.get("status") == "success" else ""
+        if candidate.startswith("https://"):
+            image_url = candidate
     # Son çare: image değilse yine candidate'i döndürme; yardım mesajı ver
     if not image_url:
         # Alternatif statik bir köpek resmi verilebilir; burada metin döndürelim
@@ -135,9 +255,10 @@ def dog_photo() -> dict:
     return {"type": "image", "animal": "dog", "image_url": image_url}
 
 
-def dog_facts() -> dict:
+@_ttl_cache(seconds=30, field="text")
+async def dog_facts() -> dict:
     """Köpek bilgisi getirir"""
-    data = _http_get_json("https://dogapi.dog/api/v2/facts?limit=1")
+    data = await _a_http_get_json("https://dogapi.dog/api/v2/facts?limit=1")
     fact = ""
     try:
         arr = data.get("data") or []
@@ -149,9 +270,10 @@ def dog_facts() -> dict:
     return {"type": "text", "animal": "dog", "text": fact}
 
 
-def cat_facts() -> dict:
+@_ttl_cache(seconds=30, field="text")
+async def cat_facts() -> dict:
     """Kedi bilgisi getirir"""
-    data = _http_get_json("https://meowfacts.herokuapp.com/")
+    data = await _a_http_get_json("https://meowfacts.herokuapp.com/")
     fact = ""
     try:
         arr = data.get("data") or []
@@ -162,9 +284,10 @@ def cat_facts() -> dict:
     return {"type": "text", "animal": "cat", "text": fact}
 
 
-def cat_photo() -> dict:
+@_ttl_cache(seconds=5, field="image_url", ring_size=5)
+async def cat_photo() -> dict:
     """Kedi fotoğrafı getirir"""
-    data = _http_get_json("https://api.thecatapi.com/v1/images/search")
+    data = await _a_http_stream_json("https://api.thecatapi.com/v1/images/search")
     url = ""
     try:
         if isinstance(data, list) and data:
@@ -174,38 +297,82 @@ def cat_photo() -> dict:
     return {"type": "image", "animal": "cat", "image_url": url}
 
 
-def fox_photo() -> dict:
+@_ttl_cache(seconds=5, field="image_url", ring_size=5)
+async def fox_photo() -> dict:
     """Tilki fotoğrafı getirir"""
-    data = _http_get_json("https://randomfox.ca/floof/")
+    data = await _a_http_stream_json("https://randomfox.ca/floof/")
     return {"type": "image", "animal": "fox", "image_url": str(data.get("image", "")).strip()}
 
 
-def duck_photo() -> dict:
+@_ttl_cache(seconds=5, field="image_url", ring_size=5)
+async def duck_photo() -> dict:
     """Ördek fotoğrafı getirir"""
-    data = _http_get_json("https://random-d.uk/api/v2/random")
+    data = await _a_http_stream_json("https://random-d.uk/api/v2/random")
     return {"type": "image", "animal": "duck", "image_url": str(data.get("url", "")).strip()}
 
 
-def _animal_keyword_router(text: str) -> dict | None:
-    """Anahtar kelime tabanlı hayvan yönlendirmesi (fallback)"""
-    t = text.lower()
-    if ("köpek" in t or "dog" in t) and ("foto" in t or "resim" in t or "image" in t or "photo" in t):
-        return dog_photo()
-    if ("köpek" in t or "dog" in t) and ("fact" in t or "bilgi" in t):
-        return dog_facts()
-    if ("kedi" in t or "cat" in t) and ("fact" in t or "bilgi" in t):
-        return cat_facts()
-    if ("kedi" in t or "cat" in t) and ("foto" in t or "resim" in t or "image" in t or "photo" in t):
-        return cat_photo()
-    if ("tilki" in t or "fox" in t) and ("foto" in t or "resim" in t or "image" in t or "photo" in t):
-        return fox_photo()
-    if ("ördek" in t or "duck" in t) and ("foto" in t or "resim" in t or "image" in t or "photo" in t):
-        return duck_photo()
-    return None
-
-
-def route_animals(user_message: str, client) -> dict | None:
-    """Ana hayvan yönlendirme fonksiyonu - function calling + fallback"""
+# Anahtar kelime yönlendiricisi: hayvan ve istek türü iki regex taramasıyla bulunur
+# (LLM yalnızca eşleşme yoksa çağrılır). Ünsüz yumuşaması: köpek → köpeği, ördek → ördeği.
+# Baştaki \b kelime içi eşleşmeleri engeller ("application"daki cat); Türkçe ekler serbest kalır
+_ANIMAL_RE = re.compile(r'\b(köpek|köpeğ|dog|kedi|cat|tilki|fox|ördek|ördeğ|duck)', re.IGNORECASE)
+_MODIFIER_RE = re.compile(r'(foto|resim|image|photo|fact|bilgi)', re.IGNORECASE)
+_ANIMAL_KEYWORDS = {
+    "köpek": "dog", "köpeğ": "dog", "dog": "dog",
+    "kedi": "cat", "cat": "cat",
+    "tilki": "fox", "fox": "fox",
+    "ördek": "duck", "ördeğ": "duck", "duck": "duck",
+}
+_MODIFIER_KEYWORDS = {
+    "foto": "photo", "resim": "photo", "image": "photo", "photo": "photo",
+    "fact": "facts", "bilgi": "facts",
+}
+
+_ANIMAL_FUNCTIONS = {
+    "dog_photo": dog_photo,
+    "dog_facts": dog_facts,
+    "cat_facts": cat_facts,
+    "cat_photo": cat_photo,
+    "fox_photo": fox_photo,
+    "duck_photo": duck_photo,
+}
+
+
+def _match_animal_function(text: str) -> str | None:
+    """Mesajdaki hayvan + istek türüne karşılık gelen fonksiyon adını döndürür"""
+    animal_match = _ANIMAL_RE.search(text)
+    if not animal_match:
+        return None
+    modifier_match = _MODIFIER_RE.search(text)
+    if not modifier_match:
+        return None
+    animal = _ANIMAL_KEYWORDS[animal_match.group(1).lower()]
+    kind = _MODIFIER_KEYWORDS[modifier_match.group(1).lower()]
+    fn_name = f"{animal}_{kind}"
+    return fn_name if fn_name in _ANIMAL_FUNCTIONS else None
+
+
+async def _animal_keyword_router(text: str) -> dict | None:
+    """Anahtar kelime tabanlı hayvan yönlendirmesi (LLM çağrısından önce denenir)"""
+    fn_name = _match_animal_function(text)
+    if not fn_name:
+        return None
+    return await _ANIMAL_FUNCTIONS[fn_name]()
+
+
+@lru_cache(maxsize=1)
+def _gemini_model():
+    """Gemini modelini bir kez yapılandırıp döndürür (fallback çağrıları paylaşır)"""
+    # Gemini API'yi yapılandır - sadece API key ile
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel('gemini-2.5-flash')
+
+
+async def route_animals(user_message: str, client) -> dict | None:
+    """Ana hayvan yönlendirme fonksiyonu - anahtar kelime + function calling + fallback.
+
+    `client` paylaşılan bir AsyncOpenAI istemcisidir (çağrı başına oluşturulmaz).
+    """
     # OpenAI client ile function calling yaparak hayvan API'lerini çağırır
     # Memory sistemi ana sistem tarafından ConversationSummaryBufferMemory ile yönetiliyor
     # Güvenlik kontrolleri
@@ -217,17 +384,22 @@ def route_animals(user_message: str, client) -> dict | None:
         return {"type": "text", "animal": "error", "text": f"Mesaj çok uzun. Maksimum {MAX_ANIMAL_MESSAGE_LENGTH} karakter olabilir."}
     
     # Input sanitization
-    user_message = _sanitize_animal_input(user_message)
-    if user_message == "[Güvenlik nedeniyle mesaj filtrelendi]":
+    user_message = sanitize(user_message, source="ANIMAL")
+    if user_message == FILTERED_MESSAGE:
         return {"type": "text", "animal": "error", "text": "Güvenlik nedeniyle mesaj filtrelendi"}
     
-    # OpenAI modeli ile fonksiyon çağırma dene; olmazsa anahtar kelimeye düş
+    # Açık anahtar kelime eşleşmesi varsa LLM çağrısına gerek yok
+    keyword_result = await _animal_keyword_router(user_message)
+    if keyword_result is not None:
+        return keyword_result
+    
+    # OpenAI modeli ile fonksiyon çağırma dene
     try:
-        # OpenAI API test et
-        completion = client.chat.completions.create(
+        # Paylaşılan AsyncOpenAI istemcisi: thread gerekmez, keep-alive bağlantısı tekrar kullanılır
+        completion = await client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
-                {"role": "system", "content": ANIMAL_SYSTEM_PROMPT},
+                _ANIMAL_SYSTEM_MESSAGE,
                 {"role": "user", "content": user_message},
             ],
             functions=ANIMAL_FUNCTIONS_SPEC,
@@ -238,56 +410,23 @@ def route_animals(user_message: str, client) -> dict | None:
         fn_name = getattr(getattr(msg, "function_call", None), "name", None)
         if not fn_name:
             return None
-        mapping = {
-            "dog_photo": dog_photo,
-            "dog_facts": dog_facts,
-            "cat_facts": cat_facts,
-            "cat_photo": cat_photo,
-            "fox_photo": fox_photo,
-            "duck_photo": duck_photo,
-        }
-        func = mapping.get(fn_name)
-        return func() if func else None
+        func = _ANIMAL_FUNCTIONS.get(fn_name)
+        return await func() if func else None
     except Exception as e:
         print(f"[ANIMAL] OpenAI API hatası: {e}")
         # OpenAI başarısız olursa Gemini ile dene
         try:
-            # Gemini API'yi yapılandır - sadece API key ile
-            import google.generativeai as genai
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-2.5-flash')
+            model = _gemini_model()
             
             # Gemini için prompt oluştur
-            prompt = f"""
-{ANIMAL_SYSTEM_PROMPT}
-
-Kullanıcı mesajı: {user_message}
-
-Bu mesajda hangi hayvan API'sini çağırmam gerekiyor? Sadece şu seçeneklerden birini seç:
-- dog_photo: Köpek fotoğrafı
-- dog_facts: Köpek bilgisi  
-- cat_facts: Kedi bilgisi
-- cat_photo: Kedi fotoğrafı
-- fox_photo: Tilki fotoğrafı
-- duck_photo: Ördek fotoğrafı
-
-Sadece fonksiyon adını yazın, başka bir şey yazmayın.
-"""
+            prompt = _GEMINI_ANIMAL_PROMPT.format(user_message=user_message)
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             fn_name = response.text.strip()
             
-            mapping = {
-                "dog_photo": dog_photo,
-                "dog_facts": dog_facts,
-                "cat_facts": cat_facts,
-                "cat_photo": cat_photo,
-                "fox_photo": fox_photo,
-                "duck_photo": duck_photo,
-            }
-            if fn_name in mapping:
+            if fn_name in _ANIMAL_FUNCTIONS:
                 print(f"[ANIMAL] Gemini API kullanılıyor: {fn_name}")
-                return mapping[fn_name]()
+                return await _ANIMAL_FUNCTIONS[fn_name]()
             else:
                 # LLM fonksiyon öneremedi; sonuç yok
                 return None
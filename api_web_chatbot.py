@@ -10,11 +10,27 @@ Bu dosya LangChain chain yapısı ile tüm sistemleri koordine eder.
 
 import os
 import re
-import html
-from typing import Any, Dict
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+import json
+import logging
+import time
+import asyncio
+import contextlib
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping
+import httpx
+import openai
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -27,58 +43,131 @@ from langchain.memory import ConversationSummaryBufferMemory
 # Sistem modüllerini import et
 from emotion_system import EmotionChatbot
 from statistic_system import StatisticSystem
-from animal_system import route_animals, _animal_emoji
+from security import FILTERED_MESSAGE, MAX_MESSAGE_LENGTH, collapse_whitespace, normalize_cache_text, sanitize
+from animal_system import (
+    route_animals,
+    _animal_emoji,
+    _match_animal_function,
+    _ANIMAL_RE,
+    aclose_http_client,
+    warm_up_connections,
+)
 from rag_service import rag_service
 
 load_dotenv()
 
-app = FastAPI(title="CHAIN SYSTEM - Akıllı Chatbot Sistemi", version="3.0.0")
+# Ham LLM çıktıları gibi ayrıntılı loglar DEBUG seviyesindedir; LOG_LEVEL=DEBUG ile açılır
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="CHAIN SYSTEM - Akıllı Chatbot Sistemi",
+    version="3.0.0",
+    default_response_class=ORJSONResponse,  # orjson ile hızlı JSON serileştirme
+)
+
+# =============================================================================
+# PAYLAŞILAN OPENAI İSTEMCİSİ
+# =============================================================================
+# Tüm OpenAI çağrıları (LangChain LLM, hayvan, duygu) aynı keep-alive havuzunu
+# kullanır; bir kullanıcı mesajındaki ardışık çağrılar TLS el sıkışması ödemez
+_openai_http_client = httpx.Client(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=30.0),
+)
+_openai_client: openai.OpenAI | None = None
+
+
+def get_openai_client() -> openai.OpenAI:
+    """Paylaşılan OpenAI istemcisini döndürür (lazy-init; API key yoksa hata fırlatır)"""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai.OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=_openai_http_client,
+        )
+    return _openai_client
+
+
+# Asenkron yol (hayvan function calling) için aynı ayarlarla async istemci;
+# event loop içinde thread'e ihtiyaç duymadan çağrılır
+_openai_async_http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=30.0),
+)
+_openai_async_client: openai.AsyncOpenAI | None = None
+
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """Paylaşılan AsyncOpenAI istemcisini döndürür (lazy-init)"""
+    global _openai_async_client
+    if _openai_async_client is None:
+        _openai_async_client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=_openai_async_http_client,
+        )
+    return _openai_async_client
+
 
 # LangChain LLM instance - Fallback mekanizması ile
-def get_llm():
-    """OpenAI API geçersizse Gemini'yi kullan"""
+# Sağlayıcı seçimi açılışta ağ çağrısı yapmadan (API key varlığına göre) yapılır;
+# OpenAI ilk gerçek çağrıda başarısız olursa chain'ler Gemini'ye düşer
+LLM_FALLBACK_ERRORS = (
+    openai.AuthenticationError,
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+)
+
+
+def _build_gemini_llm():
+    """GEMINI_API_KEY varsa LangChain Gemini LLM'ini döndürür, yoksa None"""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
     try:
-        # OpenAI API'yi test et
-        print("[LLM] OpenAI API test ediliyor...")
-        test_llm = OpenAI(temperature=0.1, max_tokens=1000, request_timeout=15)
-        # Basit bir test çağrısı yap
-        test_result = test_llm.invoke("test")
-        print(f"[LLM] OpenAI test sonucu: {test_result}")
-        print("[LLM] OpenAI API kullanılıyor")
-        return test_llm
+        # LangChain wrapper oluştur - Google Cloud credentials olmadan
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash",
+            temperature=0.1,
+            max_tokens=1000,
+            request_timeout=15,
+            google_api_key=api_key
+        )
     except Exception as e:
-        print(f"[LLM] OpenAI API hatası: {e}")
-        try:
-            # Gemini API'yi test et - sadece API key ile
-            print("[LLM] Gemini API test ediliyor...")
-            import google.generativeai as genai
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise Exception("GEMINI_API_KEY bulunamadı")
-            genai.configure(api_key=api_key)
-            
-            # LangChain olmadan direkt Gemini kullan
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            # Test çağrısı yap
-            response = model.generate_content("test")
-            print(f"[LLM] Gemini test sonucu: {response.text}")
-            
-            # LangChain wrapper oluştur - Google Cloud credentials olmadan
-            from langchain_google_genai import ChatGoogleGenerativeAI
-            gemini_llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash",
-                temperature=0.1,
-                max_tokens=1000,
-                request_timeout=15,
-                google_api_key=api_key
-            )
-            print("[LLM] Gemini API kullanılıyor")
-            return gemini_llm
-        except Exception as gemini_error:
-            print(f"[LLM] Gemini API hatası: {gemini_error}")
-            raise Exception(f"API hatası - OpenAI: {e}, Gemini: {gemini_error}")
+        print(f"[LLM] Gemini LLM oluşturulamadı: {e}")
+        return None
+
+
+def get_llm():
+    """OpenAI API key varsa OpenAI'yi, yoksa Gemini'yi kullan (test çağrısı yapılmaz)"""
+    if os.getenv("OPENAI_API_KEY"):
+        print("[LLM] OpenAI API kullanılıyor")
+        return OpenAI(
+            temperature=0.1,
+            max_tokens=1000,
+            request_timeout=15,
+            http_client=_openai_http_client,
+        )
+    gemini_llm = _build_gemini_llm()
+    if gemini_llm is None:
+        raise Exception("API hatası - OPENAI_API_KEY ve GEMINI_API_KEY bulunamadı")
+    print("[LLM] Gemini API kullanılıyor")
+    return gemini_llm
+
 
 llm = get_llm()
+# Chain'lerde kullanılan LLM: OpenAI kimlik/kota/bağlantı hatasında Gemini'ye geçer.
+# Memory özetleyicisi LLM tipinde nesne beklediğinden `llm` ayrıca tutulur.
+_gemini_fallback = _build_gemini_llm() if os.getenv("OPENAI_API_KEY") else None
+chain_llm = (
+    llm.with_fallbacks([_gemini_fallback], exceptions_to_handle=LLM_FALLBACK_ERRORS)
+    if _gemini_fallback is not None
+    else llm
+)
 
 # =============================================================================
 # CONVERSATIONSUMMARYBUFFERMEMORY - GLOBAL MEMORY SİSTEMİ
@@ -93,6 +182,46 @@ memory = ConversationSummaryBufferMemory(
     return_messages=True  # Mesaj formatında döndür - LangChain uyumluluğu için
 )
 
+MEMORY_QUEUE_MAXLEN = 20  # Yazılmayı bekleyen en fazla konuşma sayısı
+
+
+class MemoryWriter:
+    """Memory kayıtlarını istek yolundan çıkarır.
+
+    save_context limit aşıldığında özet için LLM çağırır; bu yüzden kayıtlar sınırlı
+    bir kuyruğa alınır ve tek bir arka plan thread'i tarafından sırayla yazılır.
+    Yanıt kullanıcıya özetleme beklenmeden döner. Kuyruk dolarsa en eski kayıt düşer.
+    """
+
+    def __init__(self, target: ConversationSummaryBufferMemory, maxlen: int = MEMORY_QUEUE_MAXLEN) -> None:
+        self._target = target
+        self._pending: deque[tuple[str, str]] = deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def append(self, user_message: str, output: Any) -> None:
+        """Konuşmayı kuyruğa ekler (bloklamaz)"""
+        with self._cond:
+            self._pending.append((user_message, output if isinstance(output, str) else str(output)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                user_message, output = self._pending.popleft()
+            try:
+                self._target.save_context({"input": user_message}, {"output": output})
+            except Exception as e:
+                print(f"[MEMORY] Kayıt hatası: {e}")
+
+
+memory_writer = MemoryWriter(memory)
+
 # Global chatbot instance
 chatbot_instance: EmotionChatbot | None = None
 
@@ -101,7 +230,8 @@ chatbot_instance: EmotionChatbot | None = None
 # =============================================================================
 # T5-small ile transformers pipeline kullanılır. Lazy-init yapılır ve tek instance
 # tutulur. Kullanıcı mesajı yaklaşık 200 token'i aşarsa tetiklenir.
-_summarizer_pipeline = None  # Lazy init: ilk kullanımda yüklenir
+_summarizer_pipeline = None  # Açılışta arka planda yüklenir; olmazsa ilk kullanımda (lazy)
+_summarizer_lock = threading.Lock()  # Açılış yüklemesi ile ilk istek modeli iki kez yüklemesin
 
 def _get_device_id() -> int:
     """Transformers pipeline için cihaz kimliğini döndürür.
@@ -115,100 +245,294 @@ def _get_device_id() -> int:
         return -1
 
 
+# CPU'da T5-small ONNX'e aktarılıp int8 dinamik kuantize edilir (optimum varsa);
+# aktarılan model diske yazılır, sonraki açılışlarda tekrar export edilmez
+SUMMARIZER_MODEL = "t5-small"
+SUMMARIZER_ONNX_DIR = Path(__file__).parent / ".onnx" / "t5-small-int8"
+SUMMARIZER_MAX_INPUT_TOKENS = 512  # T5-small bağlam uzunluğu
+SUMMARIZE_TOKEN_THRESHOLD = 200  # Bu eşiğin üstündeki duygu mesajları özetlenir
+_SUMMARIZER_ONNX_FILES = ("encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx")
+
+
+def _load_onnx_summarizer():
+    """T5-small'ı int8 ONNX Runtime modeli olarak yükler (optimum yoksa hata fırlatır)"""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer  # type: ignore
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig  # type: ignore
+    from transformers import AutoTokenizer, pipeline  # type: ignore
+
+    quantized_files = [f.replace(".onnx", "_quantized.onnx") for f in _SUMMARIZER_ONNX_FILES]
+    if not all((SUMMARIZER_ONNX_DIR / f).exists() for f in quantized_files):
+        print("[SUMMARIZER] T5-small ONNX'e aktarılıyor ve int8 kuantize ediliyor (bir kez)...")
+        export_dir = SUMMARIZER_ONNX_DIR / "fp32"
+        ORTModelForSeq2SeqLM.from_pretrained(SUMMARIZER_MODEL, export=True).save_pretrained(export_dir)
+        qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        for file_name in _SUMMARIZER_ONNX_FILES:
+            quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=file_name)
+            quantizer.quantize(save_dir=SUMMARIZER_ONNX_DIR, quantization_config=qconfig)
+    model = ORTModelForSeq2SeqLM.from_pretrained(
+        SUMMARIZER_ONNX_DIR,
+        encoder_file_name=quantized_files[0],
+        decoder_file_name=quantized_files[1],
+        decoder_with_past_file_name=quantized_files[2],
+    )
+    tokenizer = AutoTokenizer.from_pretrained(SUMMARIZER_MODEL)
+    return pipeline("summarization", model=model, tokenizer=tokenizer)
+
+
+def _compile_summarizer(summarizer) -> None:
+    """PyTorch özetleyicinin forward'ını torch.compile ile derler ve bir kez ısıtır.
+
+    Pipeline nesnesi değil modelin forward'ı derlenir; generate her decode adımında
+    bu forward'ı çağırır. GPU'da "reduce-overhead" decode adımlarını CUDA graph olarak
+    yakalayıp tekrar oynatır; bunun için KV önbelleği statik (sabit boyutlu) tutulur,
+    aksi halde her adımda şekil değişir ve graph yeniden kaydedilir.
+    torch.compile yoksa veya derleme başarısızsa sessizce derlenmemiş modelle devam edilir.
+    """
+    generation_config = getattr(summarizer.model, "generation_config", None)
+    previous_cache = getattr(generation_config, "cache_implementation", None)
+    try:
+        import torch  # type: ignore
+        if not hasattr(torch, "compile"):
+            return
+        model = summarizer.model
+        model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False, dynamic=True)
+        # İlk gerçek isteğin derleme maliyetini ödememesi için ısınma çağrısı
+        inputs = summarizer.tokenizer(["summarize: warmup"], return_tensors="pt").to(model.device)
+        if model.device.type == "cuda" and generation_config is not None:
+            try:
+                generation_config.cache_implementation = "static"
+                with torch.inference_mode():
+                    model.generate(**inputs, max_new_tokens=16, num_beams=1)
+                print("[SUMMARIZER] Model torch.compile + statik KV önbelleği ile derlendi")
+                return
+            except Exception as e:
+                # Model/transformers sürümü statik önbelleği desteklemiyorsa dinamik devam et
+                print(f"[SUMMARIZER] Statik KV önbelleği kullanılamadı: {e}")
+                generation_config.cache_implementation = previous_cache
+        with torch.inference_mode():
+            model.generate(**inputs, max_new_tokens=16, num_beams=1)
+        print("[SUMMARIZER] Model torch.compile ile derlendi")
+    except Exception as e:
+        print(f"[SUMMARIZER] torch.compile atlandı: {e}")
+        try:
+            # Derleme yarıda kaldıysa orijinal forward'a ve önbellek ayarına dön
+            del summarizer.model.forward
+        except Exception:
+            pass
+        if generation_config is not None:
+            generation_config.cache_implementation = previous_cache
+
+
 def _get_summarizer():
-    """T5-small summarization pipeline'ını döndürür (lazy-init)."""
+    """T5-small summarization pipeline'ını döndürür (lazy-init).
+
+    CPU'da önce int8 ONNX Runtime modeli denenir; GPU varsa veya optimum
+    kurulu değilse PyTorch pipeline'ına düşülür.
+    """
     global _summarizer_pipeline
     if _summarizer_pipeline is not None:
         return _summarizer_pipeline
+    with _summarizer_lock:
+        if _summarizer_pipeline is None:
+            _summarizer_pipeline = _load_summarizer()
+    return _summarizer_pipeline
+
+
+def _load_summarizer():
+    """Özetleyiciyi yükler (önce ONNX/CPU, sonra PyTorch); başarısızsa None döndürür"""
+    device_id = _get_device_id()
+    if device_id < 0:
+        try:
+            summarizer = _load_onnx_summarizer()
+            print("[SUMMARIZER] ONNX Runtime (int8) özetleyici kullanılıyor")
+            return summarizer
+        except Exception as e:
+            print(f"[SUMMARIZER] ONNX özetleyici yüklenemedi, PyTorch kullanılacak: {e}")
     try:
         # Transformers'ı sadece gerektiğinde yükle
         from transformers import pipeline  # type: ignore
-        device_id = _get_device_id()
-        _summarizer_pipeline = pipeline(
+        model_kwargs = {}
+        if device_id >= 0:
+            # GPU'da yarı hassasiyet: T5 fp16'da taşma (NaN) yapabildiği için
+            # destekleniyorsa bfloat16, değilse float16 kullanılır
+            import torch  # type: ignore
+            model_kwargs["torch_dtype"] = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        summarizer = pipeline(
             "summarization",
-            model="t5-small",
+            model=SUMMARIZER_MODEL,
             device=device_id,
+            model_kwargs=model_kwargs,
         )
-        return _summarizer_pipeline
+        _compile_summarizer(summarizer)
+        return summarizer
     except Exception as e:
         # Özetleyici yüklenemezse None döndür ve akışı engelleme
         print(f"[SUMMARIZER] Yükleme hatası: {e}")
         return None
 
 
-def _summarize_text_if_needed(text: str, estimated_tokens: int, token_threshold: int = 200) -> str:
-    """Mesaj token tahmini eşik değerini aşıyorsa metni kısaltır.
+def _inference_mode():
+    """torch.inference_mode bağlamını döndürür; torch yoksa etkisiz bağlam"""
+    try:
+        import torch  # type: ignore
+        return torch.inference_mode()
+    except Exception:
+        return contextlib.nullcontext()
+
+
+def _summarize_batch(texts: list[str]) -> list[str]:
+    """Metinleri tek generate çağrısında özetler; başarısız/boş özetlerde orijinali döndürür.
 
     Güvenlik/sağlamlık notları:
-    - Transformers bağımlılığı yoksa veya model yüklenemezse orijinal metni döndürür
+    - Transformers bağımlılığı yoksa veya model yüklenemezse orijinal metinleri döndürür
     - T5 için "summarize:" prefix'i kullanılır; Türkçe girişlerde de çalışır
-    - max_new_tokens/min_new_tokens, girdinin uzunluğuna göre ölçeklenir
+    - max_new_tokens/min_new_tokens, batch'teki en uzun girdiye göre ölçeklenir
     """
     try:
-        if estimated_tokens <= token_threshold:
-            return text
-
         summarizer = _get_summarizer()
         if summarizer is None:
-            return text
+            return texts
 
         # T5 özetleme: İngilizce ön-ek; Türkçe için de kabul edilebilir
-        prefixed = "summarize: " + text
-
-        # Tokenizer varsa giriş uzunluğuna göre dinamik ayar yap
-        try:
-            input_len = len(summarizer.tokenizer(prefixed)["input_ids"])  # type: ignore[attr-defined]
-        except Exception:
-            # Tokenizer'a erişilemezse kaba tahmin ile çalış
-            input_len = max(60, len(prefixed) // 4)
+        prefixed = ["summarize: " + t for t in texts]
+
+        # Girdiler bir kez tokenize edilir (batch için padding ile); aynı tensörler hem
+        # uzunluk hesabında hem generate'te kullanılır
+        tokenizer, model = summarizer.tokenizer, summarizer.model
+        inputs = tokenizer(
+            prefixed, return_tensors="pt", truncation=True, padding=True,
+            max_length=SUMMARIZER_MAX_INPUT_TOKENS,
+        )
+        inputs = {k: v.to(model.device, non_blocking=True) for k, v in inputs.items()}
+        input_len = int(inputs["input_ids"].shape[1])
 
         # Çıkış uzunluğu: girişin ~%30-50'si; alt/üst sınırlar güvenlik için
         new_tokens = max(32, min(160, int(input_len * 0.4)))
         min_new = max(16, int(new_tokens * 0.4))
 
-        result = summarizer(
-            prefixed,
-            max_new_tokens=new_tokens,
-            min_new_tokens=min_new,
-            do_sample=False,
-        )
-        summary = ""
-        try:
-            summary = (result[0] or {}).get("summary_text", "").strip()
-        except Exception:
-            summary = ""
-
-        # Boş dönerse orijinal metni koru
-        if not summary:
-            return text
-
-        # Konsola kısaltılmış çıktıyı yaz (istenen gereksinim)
-        print(f"[SUMMARIZER] Kısaltılmış metin: {summary}")
-        return summary
+        # generate encoder'ı bir kez çalıştırır; decoder adımları KV önbelleğini
+        # (use_cache) ve bu encoder çıktısını tekrar kullanır
+        # inference_mode: autograd kaydı tutulmaz (ONNX modelinde etkisizdir)
+        with _inference_mode():
+            output_ids = model.generate(
+                **inputs,
+                max_new_tokens=new_tokens,
+                min_new_tokens=min_new,
+                do_sample=False,
+                num_beams=1,  # Greedy decode: beam search her adımı num_beams kat pahalı yapar
+                use_cache=True,
+            )
+        summaries = tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+        results = []
+        for original, summary in zip(texts, summaries):
+            summary = summary.strip()
+            # Boş dönerse orijinal metni koru
+            if not summary:
+                results.append(original)
+                continue
+            # Konsola kısaltılmış çıktıyı yaz (istenen gereksinim)
+            print(f"[SUMMARIZER] Kısaltılmış metin: {summary}")
+            results.append(summary)
+        return results
     except Exception as e:
-        # Her türlü hata durumunda orijinal metni döndür
+        # Her türlü hata durumunda orijinal metinleri döndür
         print(f"[SUMMARIZER] Çalışma hatası: {e}")
+        return texts
+
+
+def _summarize_text_if_needed(text: str, estimated_tokens: int, token_threshold: int = SUMMARIZE_TOKEN_THRESHOLD) -> str:
+    """Mesaj token tahmini eşik değerini aşıyorsa metni kısaltır (tekil, senkron kullanım)"""
+    if estimated_tokens <= token_threshold:
         return text
+    return _summarize_batch([text])[0]
+
+
+SUMMARIZER_BATCH_SIZE = 8  # Tek generate çağrısında en fazla özetlenecek mesaj
+SUMMARIZER_BATCH_WINDOW = 0.02  # İlk istekten sonra batch'in dolmasını bekleme süresi (saniye)
+
 
-# RAG modelini asenkron olarak önceden yükle
-print("[CHAIN SYSTEM] RAG modeli asenkron olarak yükleniyor...")
-rag_service.preload_model_async()
+class SummarizerBatcher:
+    """Eşzamanlı özetleme isteklerini kısa bir pencerede toplayıp tek batch'te çalıştırır.
+
+    İlk istek geldikten sonra en fazla SUMMARIZER_BATCH_WINDOW saniye ya da batch
+    SUMMARIZER_BATCH_SIZE'a ulaşana kadar beklenir; model thread havuzunda çalışır.
+    """
+
+    def __init__(self, max_batch: int = SUMMARIZER_BATCH_SIZE, window: float = SUMMARIZER_BATCH_WINDOW) -> None:
+        self.max_batch = max_batch
+        self.window = window
+        self._queue: asyncio.Queue[tuple[str, asyncio.Future]] | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def submit(self, text: str) -> str:
+        """Metni kuyruğa ekler ve özetini (ya da orijinalini) bekler"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            texts = [text for text, _ in batch]
+            if len(batch) > 1:
+                print(f"[SUMMARIZER] {len(batch)} mesaj tek batch'te özetleniyor")
+            results = await run_in_threadpool(_summarize_batch, texts)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+summarizer_batcher = SummarizerBatcher()
+
+
+def _warm_up_summarizer_model() -> None:
+    """Özetleyiciyi yükler ve kısa bir generate ile ısıtır (ONNX oturumu/CUDA bağlamı)"""
+    summarizer = _get_summarizer()
+    if summarizer is None:
+        return
+    try:
+        inputs = summarizer.tokenizer(["summarize: warmup"], return_tensors="pt")
+        inputs = {k: v.to(summarizer.model.device) for k, v in inputs.items()}
+        with _inference_mode():
+            summarizer.model.generate(**inputs, max_new_tokens=8, num_beams=1)
+        print("[SUMMARIZER] Özetleyici hazır ✅")
+    except Exception as e:
+        print(f"[SUMMARIZER] Isınma çağrısı başarısız: {e}")
+
+# RAG hazır olma kapısı: embedding modeli ve indeks startup'ta arka planda yüklenir;
+# retrieval yapan istekler en fazla RAG_READY_TIMEOUT saniye bunu bekler
+RAG_READY_TIMEOUT = 30.0
+_rag_ready = asyncio.Event()
 
 # Güvenlik sabitleri
-MAX_MESSAGE_LENGTH = 2000  # Maksimum mesaj uzunluğu
 MAX_TOKENS_PER_REQUEST = 1000  # Maksimum token sayısı
-DANGEROUS_PATTERNS = [
-    r'<script[^>]*>.*?</script>',  # Script injection
-    r'javascript:',  # JavaScript URL
-    r'data:text/html',  # Data URL
-    r'vbscript:',  # VBScript
-    r'on\w+\s*=',  # Event handlers
-    r'<iframe[^>]*>',  # Iframe injection
-    r'<object[^>]*>',  # Object injection
-    r'<embed[^>]*>',  # Embed injection
-    r'<link[^>]*>',  # Link injection
-    r'<meta[^>]*>',  # Meta injection
-]
+FLOW_CACHE_MAXSIZE = 2048  # Akış kararı önbelleği kapasitesi
+FLOW_CACHE_TTL = 300  # Akış kararı önbelleği tazeleme süresi (saniye)
+RESPONSE_CACHE_MAXSIZE = 4096  # /chat yanıt önbelleği kapasitesi
+RESPONSE_CACHE_TTL = 600  # /chat yanıt önbelleği süresi (saniye)
+CHAT_RATE_LIMIT = 30  # İstemci (IP) başına pencere içinde izin verilen chat isteği
+CHAT_RATE_WINDOW = 60.0  # Hız sınırı penceresi (saniye)
+RATE_LIMIT_MAX_CLIENTS = 10000  # Takip edilen en fazla istemci (LRU)
+UPSTREAM_CONCURRENCY = 32  # Worker başına aynı anda çalışan en fazla chain (LLM/API çağrısı)
+# Yanıtı mesajdan başka bir şeye bağlı olmayan akışlar önbelleğe alınır
+# (ANIMAL rastgele, EMOTION konuşmaya ve sayaçlara, STATS güncel veriye bağlıdır)
+RESPONSE_CACHEABLE_FLOWS = frozenset({"RAG", "HELP"})
+# RAG modeli bağlam yetersizken bu ifadeyle yanıt verir; bu yanıtlar önbelleğe alınmaz
+RAG_NO_CONTEXT_MARKER = "Bağlamda yeterli bilgi yok"
 
 # RAG kaynakları (UI id'leri sabit: pdf-python/anayasa/clean)
 RAG_SOURCES = {
@@ -223,7 +547,187 @@ try:
     STATIC_DIR.mkdir(parents=True, exist_ok=True)
 except Exception:
     pass
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+# Dosya adları hash'li olmadığından uzun "immutable" yerine kısa max-age + ETag ile
+# yeniden doğrulama kullanılır (değişen CSS/JS en geç bir saatte alınır)
+STATIC_MAX_AGE = 3600
+STATIC_GZIP_SUFFIXES = frozenset({".js", ".css", ".html", ".svg", ".json", ".txt"})
+STATIC_GZIP_MIN_SIZE = 1024  # Bu boyuttan küçük dosyalar sıkıştırılmaz
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Accept-Encoding başlığında gzip'in q > 0 ile kabul edilip edilmediğini döndürür.
+
+    Açık "gzip;q=0" reddedilmiş sayılır; gzip geçmiyorsa "*" değerine bakılır.
+    """
+    wildcard = False
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        coding = coding.strip().lower()
+        if coding in ("gzip", "x-gzip"):
+            return q > 0
+        if coding == "*":
+            wildcard = q > 0
+    return wildcard
+
+
+class CachedStaticFiles(StaticFiles):
+    """Statik dosyalar için Cache-Control başlığı ve bellekte tutulan gzip sürümleri.
+
+    Sıkıştırılmış içerik mount sırasında bir kez üretilir; dosya sonradan değişirse
+    yeni sürüm thread havuzunda üretilir (event loop bloklanmaz). Sıkıştırılabilir
+    dosyaların tüm yanıtları `Vary: Accept-Encoding` taşır.
+    """
+
+    def __init__(self, *args: Any, max_age: int = STATIC_MAX_AGE, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}"
+        self._gzip_cache: Dict[str, tuple[float, bytes]] = {}
+        self._precompress()
+
+    @staticmethod
+    def _gzip_eligible(full_path: str, size: int) -> bool:
+        return Path(full_path).suffix in STATIC_GZIP_SUFFIXES and size >= STATIC_GZIP_MIN_SIZE
+
+    def _precompress(self) -> None:
+        """Dizindeki sıkıştırılabilir dosyaların gzip sürümlerini önceden üretir"""
+        if self.directory is None:
+            return
+        root = os.path.realpath(self.directory)
+        try:
+            for path in Path(root).rglob("*"):
+                if path.is_file():
+                    st = path.stat()
+                    if self._gzip_eligible(str(path), st.st_size):
+                        self._gzipped(str(path), st.st_mtime)
+        except Exception as e:
+            print(f"[STATIC] gzip ön sıkıştırma başarısız: {e}")
+        print(f"[STATIC] {len(self._gzip_cache)} dosya gzip ile önceden sıkıştırıldı")
+
+    def _gzipped(self, full_path: str, mtime: float) -> bytes:
+        """Dosyanın gzip sürümünü döndürür (mtime değişmediyse önbellekten)"""
+        cached = self._gzip_cache.get(full_path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, gzip.compress(Path(full_path).read_bytes(), compresslevel=9))
+            self._gzip_cache[full_path] = cached
+        return cached[1]
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = self.cache_control
+        if self._gzip_eligible(str(full_path), stat_result.st_size):
+            # Paylaşılan önbellekler sıkıştırılmış/sıkıştırılmamış sürümleri ayrı tutsun
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if (
+            not isinstance(response, FileResponse)
+            or response.status_code != 200
+            or response.stat_result is None
+            or "vary" not in response.headers
+            or not _accepts_gzip(Headers(scope=scope).get("accept-encoding", ""))
+        ):
+            return response
+        full_path = str(response.path)
+        mtime = response.stat_result.st_mtime
+        cached = self._gzip_cache.get(full_path)
+        if cached is not None and cached[0] == mtime:
+            body = cached[1]
+        else:
+            # Dosya değişmiş (veya mount sonrası eklenmiş): sıkıştırma loop dışında yapılır
+            body = await run_in_threadpool(self._gzipped, full_path, mtime)
+        headers = {
+            "Cache-Control": self.cache_control,
+            "Content-Encoding": "gzip",
+            "Vary": "Accept-Encoding",
+            "Last-Modified": response.headers["last-modified"],
+            # Sıkıştırılmış gövde bayt bazında farklı; zayıf ETag ile 304 doğrulaması korunur
+            "ETag": "W/" + response.headers["etag"],
+        }
+        return Response(content=body, media_type=response.media_type, headers=headers)
+
+
+app.mount("/static", CachedStaticFiles(directory=str(STATIC_DIR)), name="static")
+
+
+# Arka plan görevlerine referans tutulur (GC tarafından toplanmasın)
+_background_tasks: set[asyncio.Task] = set()
+
+
+@app.on_event("startup")
+async def _warm_up_http_clients() -> None:
+    """İlk hayvan isteği TLS el sıkışması ödemesin diye bağlantıları arka planda açar"""
+    task = asyncio.create_task(warm_up_connections())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("startup")
+async def _init_pipeline() -> None:
+    """Chain'leri ilk istekte değil worker açılışında kurar"""
+    await run_in_threadpool(_get_pipeline)
+
+
+async def _load_rag() -> None:
+    """RAG modelini ve indeksini thread'de yükler; bitince hazır kapısını açar"""
+    try:
+        print("[CHAIN SYSTEM] RAG modeli yükleniyor...")
+        await run_in_threadpool(rag_service.load_model)
+        print("[CHAIN SYSTEM] RAG hazır ✅")
+    except Exception as e:
+        # Kapı yine açılır; retrieval ilk istekte modeli tekrar yüklemeyi dener
+        print(f"[CHAIN SYSTEM] RAG ön yükleme hatası: {e}")
+    finally:
+        _rag_ready.set()
+
+
+@app.on_event("startup")
+async def _warm_up_rag() -> None:
+    """RAG yüklemesini açılışı bloklamadan başlatır (hazır olana kadar /healthz 503 döner)"""
+    task = asyncio.create_task(_load_rag())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("startup")
+async def _warm_up_summarizer() -> None:
+    """Özetleyiciyi açılışta arka planda yükler; ilk uzun mesaj model yüklemesini beklemez"""
+    task = asyncio.create_task(run_in_threadpool(_warm_up_summarizer_model))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _wait_rag_ready() -> None:
+    """RAG yüklemesi sürüyorsa bekler; zaman aşımında retrieval yine de denenir"""
+    if _rag_ready.is_set():
+        return
+    try:
+        await asyncio.wait_for(_rag_ready.wait(), timeout=RAG_READY_TIMEOUT)
+    except asyncio.TimeoutError:
+        print("[CHAIN SYSTEM] RAG hazır değil, beklemeden devam ediliyor")
+
+
+@app.on_event("shutdown")
+async def _close_http_clients() -> None:
+    """Uygulama kapanırken paylaşılan HTTP istemcilerini kapatır"""
+    await aclose_http_client()
+    await _openai_async_http_client.aclose()
+    _openai_http_client.close()
+
+
+# Geçerli akış etiketleri tek taramada aranır (ör. "ANIMAL", "Flow: RAG", "ANIMALS")
+# Birden çok etiket geçerse öncelik sırası belirleyicidir (metindeki konumu değil)
+FLOW_PRIORITY = ("ANIMAL", "RAG", "EMOTION", "STATS", "HELP")
+FLOW_RE = re.compile("|".join(FLOW_PRIORITY))
 
 
 class FlowDecisionParser(BaseOutputParser):
@@ -231,59 +735,146 @@ class FlowDecisionParser(BaseOutputParser):
     
     def parse(self, text: str) -> str:
         """LLM çıktısını temizleyip akış kararını döndürür"""
-        text = text.strip().upper()
-        valid_flows = ["ANIMAL", "RAG", "EMOTION", "STATS", "HELP"]
-        
-        for flow in valid_flows:
-            if flow in text:
+        # Metin tek regex taramasıyla okunur; etiketler birbirinin alt dizisi olmadığından
+        # bulunanlar kümesi alt dizi aramasıyla aynıdır
+        found = set(FLOW_RE.findall(text.upper()))
+        for flow in FLOW_PRIORITY:
+            if flow in found:
                 return flow
-        
         return "HELP"  # Varsayılan fallback - yardım mesajı
 
 
-def _sanitize_input(text: str) -> str:
-    """Güvenli input sanitization - injection saldırılarını önler"""
-    if not text:
-        return ""
-    
-    # HTML escape
-    text = html.escape(text, quote=True)
-    
-    # Tehlikeli pattern'leri kontrol et
-    for pattern in DANGEROUS_PATTERNS:
-        if re.search(pattern, text, re.IGNORECASE):
-            print(f"[SECURITY] Tehlikeli pattern tespit edildi: {pattern}")
-            return "[Güvenlik nedeniyle mesaj filtrelendi]"
-    
-    # Fazla boşlukları temizle
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    return text
-
-
 def _validate_message_length(text: str) -> bool:
     """Mesaj uzunluğunu kontrol eder"""
     return len(text) <= MAX_MESSAGE_LENGTH
 
 
+# Token sayımı için tiktoken kodlayıcısı bir kez yüklenir (langchain-openai bağımlılığı);
+# yüklenemezse (ör. çevrimdışı ilk kurulum) karakter tabanlı tahmine düşülür
+try:
+    import tiktoken
+    _TOKEN_ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    print(f"[CHAIN SYSTEM] tiktoken yüklenemedi, kaba token tahmini kullanılacak: {e}")
+    _TOKEN_ENCODING = None
+
+
 def _estimate_tokens(text: str) -> int:
-    """Yaklaşık token sayısını hesaplar (Türkçe için)"""
+    """Token sayısını hesaplar (tiktoken yoksa Türkçe için yaklaşık tahmin)"""
+    if _TOKEN_ENCODING is not None:
+        # Özel token metinleri (<|endoftext|> vb.) kullanıcı girdisinde düz metin sayılır
+        return len(_TOKEN_ENCODING.encode(text, disallowed_special=()))
     # Türkçe için yaklaşık hesaplama: 1 token ≈ 4 karakter
     return len(text) // 4
 
 
+@dataclass
+class MessageContext:
+    """Doğrulanmış kullanıcı mesajı ve bir kez hesaplanan türevleri.
+
+    Endpoint'te oluşturulur ve chain boyunca taşınır; token tahmini ve anahtar
+    kelime taraması her aşamada yeniden hesaplanmaz.
+    """
+    text: str
+    tokens: int
+
+    @cached_property
+    def hints(self) -> Mapping[str, Any]:
+        """Anahtar kelime taraması (ilk erişimde bir kez yapılır)"""
+        return _scan_keywords(self.text)
+
+
 # =============================================================================
-# CHAIN SYSTEM - LangChain Chain Yapıları
+# YEREL AKIŞ SINIFLANDIRICISI
 # =============================================================================
+# Regex özellikleri × elle ayarlanmış ağırlıklar; açık niyetlerde LLM akış kararı
+# atlanır, belirsiz mesajlar LLM'e bırakılır.
+# Kaynak yönlendiricisi: tek regex taraması, adlandırılmış grup (alias) → PDF dosyası
+# (baştaki \b kelime içi eşleşmeleri engeller: "education"daki cat)
+_RAG_SOURCE_RE = re.compile(
+    r'\b(?:(?P<cat>kedi|cat)|(?P<parrot>papağan|parrot|kuş)|(?P<rabbit>tavşan|rabbit))',
+    re.IGNORECASE,
+)
+_RAG_SOURCE_BY_ALIAS = {meta["alias"]: filename for filename, meta in RAG_SOURCES.items()}
+_RAG_TOPIC_RE = re.compile(
+    r'\b(bakım|besle|mama|barın|kafes|sağlık|hastalık|eğitim|tuvalet|tırnak|care|feed|food|diet|health|train|cage)',
+    re.IGNORECASE,
+)
+_EMOTION_RE = re.compile(
+    r'(merhaba|selam|nasılsın|naber|mutlu|üzgün|öfkeli|sinirli|kızgın|endişeli|yorgun|'
+    r'hissed|hisset|canım sıkkın|sevindim|ağladım)',
+    re.IGNORECASE,
+)
+_STATS_RE = re.compile(r'(kaç kere|kaç kez|kaç defa|istatistik|en çok hangi|özet)', re.IGNORECASE)
+_HELP_RE = re.compile(r'(yardım|ne yapabilirsin|neler yapabilirsin|nasıl kullan|help)', re.IGNORECASE)
+
+# Akış → {özellik: ağırlık}; skor = eşleşen özelliklerin ağırlık toplamı
+FLOW_FEATURE_WEIGHTS: Dict[str, Dict[str, float]] = {
+    "ANIMAL": {"animal_function": 2.0, "animal": 0.5, "rag_topic": -1.5},
+    "RAG": {"rag_alias": 1.0, "rag_topic": 1.0},
+    "EMOTION": {"emotion": 2.0, "stats": -2.0},
+    "STATS": {"stats": 2.0, "emotion": 0.5},
+    "HELP": {"help": 2.0},
+}
+FLOW_SCORE_THRESHOLD = 2.0  # Doğrudan yönlendirme için en düşük skor
+FLOW_SCORE_MARGIN = 1.0  # En iyi akışın ikinciye göre en az farkı
+SHORT_MESSAGE_CHARS = 8  # Bundan kısa, konu ipucu taşımayan mesajlar sohbet sayılır
+GREETINGS = frozenset({"merhaba", "selam", "selamlar", "hi", "hello", "hey", "nasılsın", "naber", "günaydın", "iyi akşamlar"})
+
+
+@lru_cache(maxsize=FLOW_CACHE_MAXSIZE)
+def _scan_keywords(user_message: str) -> Mapping[str, Any]:
+    """Mesajı anahtar kelime regex'leriyle bir kez tarar; sonuçlar tüm adımlarca paylaşılır.
+
+    Tekrarlayan mesajlar için sonuç önbellekten döner; paylaşıldığı için salt-okunurdur.
+    """
+    source_match = _RAG_SOURCE_RE.search(user_message)
+    has_animal = _ANIMAL_RE.search(user_message) is not None
+    return MappingProxyType({
+        "animal": has_animal,
+        "animal_function": _match_animal_function(user_message) if has_animal else None,
+        "rag_alias": source_match.lastgroup if source_match else None,
+        "rag_topic": _RAG_TOPIC_RE.search(user_message) is not None,
+        "emotion": _EMOTION_RE.search(user_message) is not None,
+        "stats": _STATS_RE.search(user_message) is not None,
+        "help": _HELP_RE.search(user_message) is not None,
+    })
+
+
+def _keyword_flow_decision(hints: Mapping[str, Any]) -> str | None:
+    """Özellik skorlarından akış kararı verir; emin değilse None döner (LLM'e bırakılır)"""
+    scores = sorted(
+        (
+            (sum(weight for feature, weight in weights.items() if hints[feature]), flow)
+            for flow, weights in FLOW_FEATURE_WEIGHTS.items()
+        ),
+        reverse=True,
+    )
+    (best_score, best_flow), (second_score, _) = scores[0], scores[1]
+    if best_score >= FLOW_SCORE_THRESHOLD and best_score - second_score >= FLOW_SCORE_MARGIN:
+        return best_flow
+    return None
+
+
+def _short_message_flow(user_message: str, hints: Mapping[str, Any]) -> str | None:
+    """Kısa/selamlaşma mesajları ve yardım sorularını LLM'e sormadan yönlendirir"""
+    # Hayvan veya RAG ipucu taşıyan mesajlar kısa olsa bile belirsizdir ("kedi")
+    if hints["animal"] or hints["rag_alias"] or hints["rag_topic"]:
+        return None
+    text = user_message.strip().lower()
+    if hints["help"] and text.endswith("?"):
+        return "HELP"
+    if len(text) < SHORT_MESSAGE_CHARS or text.rstrip("!?.,") in GREETINGS:
+        return "EMOTION"
+    return None
 
-def create_flow_decision_chain():
-    """Akış kararı chain'i oluşturur - ConversationSummaryBufferMemory ile"""
-    # Memory sistemi ile akış kararı - önceki konuşma bağlamı otomatik eklenir
-    flow_prompt = PromptTemplate(
-        input_variables=["input"],
-        template="""Kullanıcının mesajını analiz et ve şu akışlardan birini seç:
 
-ÖNEMLİ KURALLAR:
+# =============================================================================
+# CHAIN SYSTEM - LangChain Chain Yapıları
+# =============================================================================
+
+# Akış seçim kuralları - akış kararı ve birleşik (akış + RAG) prompt'ları paylaşır
+FLOW_RULES = """ÖNEMLİ KURALLAR:
 1. Eğer kullanıcı BİLGİ istiyorsa (hayvan bakımı, beslenme, barınma, sağlık, eğitim, bakım önerileri) → RAG
 2. Eğer kullanıcı HAYVAN istiyorsa (köpek, kedi, tilki, ördek fotoğraf/bilgi) → ANIMAL  
 3. Eğer kullanıcı SOHBET/DUYGU istiyorsa (merhaba, nasılsın, üzgünüm, mutluyum) → EMOTION
@@ -295,40 +886,118 @@ Akışlar:
 - RAG: Kedi/Papağan/Tavşan bakımı, beslenme, barınma, sağlık, eğitim, bakım rutinleri
 - EMOTION: Duygu analizi, sohbet, normal konuşma
 - STATS: Duygu istatistikleri (today/all + isteğe bağlı duygu filtresi)
-- HELP: Yardım, ne yapabilirsin, genel bilgi istekleri
+- HELP: Yardım, ne yapabilirsin, genel bilgi istekleri"""
+
+
+# Prompt şablonları modül yüklenirken bir kez oluşturulur; chain'ler bunları paylaşır
+_FLOW_PROMPT = PromptTemplate(
+    input_variables=["input"],
+    template="""Kullanıcının mesajını analiz et ve şu akışlardan birini seç:
+
+""" + FLOW_RULES + """
 
 Kullanıcı Mesajı: {input}
 
 Sadece şu yanıtlardan birini ver: ANIMAL, RAG, EMOTION, STATS, HELP"""
-    )
-    
-    def flow_processor(input_data):
-        """Flow decision işleyicisi - Gemini ve OpenAI çıktılarını normalize eder"""
-        result = (flow_prompt | llm).invoke(input_data)
+)
+
+# RAG: tek input değişkeni; bağlam ve soru birlikte verilir
+_RAG_PROMPT = PromptTemplate(
+    input_variables=["input"],
+    template="""Sen bir hayvan bakımı bilgi asistanısın. Verilen BAĞLAM (PDF parçaları) üzerinden
+kullanıcının sorusunu YALNIZCA bağlama dayanarak yanıtla. Türkçe, kısa, net ve uygulanabilir yaz.
+
+Kesin kurallar:
+1) Doğrudan yanıt ver; bölüm/başlık/"git oku" tarzı yönlendirmeler yapma.
+2) Bağlamdaki bilgileri özlü maddeler halinde veya kısa paragraflarla aktar.
+3) Kaynak ve alıntı isimlerini yazma; sadece içerik ver.
+4) Bağlam yeterli değilse bunu açıkça söyle: "Bağlamda yeterli bilgi yok."
+5) JSON üretme; normal metin ver. Maksimum 5 cümle.
+
+SORU VE BAĞLAM: {input}
+
+YANIT:"""
+)
+
+
+# Birleşik akış kararı + RAG yanıtı (JSON çıktı)
+_FUSED_PROMPT = PromptTemplate(
+    input_variables=["input", "context"],
+    template="""Kullanıcının mesajını analiz et ve şu akışlardan birini seç:
+
+""" + FLOW_RULES + """
+
+Seçtiğin akış RAG ise kullanıcının sorusunu YALNIZCA aşağıdaki BAĞLAM'a (PDF parçaları)
+dayanarak Türkçe, kısa, net ve uygulanabilir şekilde yanıtla (maksimum 5 cümle; kaynak
+adı yazma; bağlam yeterli değilse "Bağlamda yeterli bilgi yok." de). Akış RAG değilse
+yanıt alanını boş bırak.
+
+BAĞLAM:
+{context}
+
+Kullanıcı Mesajı: {input}
+
+Sadece şu JSON formatında yanıt ver:
+{{"flow": "ANIMAL | RAG | EMOTION | STATS | HELP", "answer": "..."}}"""
+)
+
+# Şablonlar sabit; tek değişkenli olanlarda değişken etrafındaki metin bir kez ayrılır.
+# İstek başına PromptTemplate | llm (Runnable dispatch + girdi doğrulama) yerine
+# düz string birleştirme/format yapılıp llm.invoke doğrudan çağrılır
+_PROMPT_PLACEHOLDER = "\x00INPUT\x00"
+
+
+def _split_template(prompt: PromptTemplate) -> tuple[str, str]:
+    """Tek değişkenli ({input}) şablonu (önek, sonek) olarak ayırır"""
+    prefix, suffix = prompt.format(input=_PROMPT_PLACEHOLDER).split(_PROMPT_PLACEHOLDER)
+    return prefix, suffix
+
+
+_FLOW_PREFIX, _FLOW_SUFFIX = _split_template(_FLOW_PROMPT)
+_RAG_PREFIX, _RAG_SUFFIX = _split_template(_RAG_PROMPT)
+_FUSED_TEMPLATE = _FUSED_PROMPT.template  # str.format ile doldurulur ({{ }} kaçışları aynı)
+
+# Parser durumsuz olduğundan tek örnek paylaşılır
+_FLOW_PARSER = FlowDecisionParser()
+
+
+def create_flow_decision_chain():
+    """Akış kararı chain'i oluşturur - ConversationSummaryBufferMemory ile"""
+    # Aynı (normalize edilmiş) mesaj için LLM tekrar çağrılmaz; ikinci argüman
+    # zaman dilimi olduğundan kayıtlar en geç FLOW_CACHE_TTL saniyede tazelenir
+    @lru_cache(maxsize=FLOW_CACHE_MAXSIZE)
+    def cached_flow_decision(normalized_input: str, ttl_bucket: int) -> str:
+        """LLM ile akış kararı verir (sonuç önbelleğe alınır)"""
+        result = chain_llm.invoke(_FLOW_PREFIX + normalized_input + _FLOW_SUFFIX)
         
-        # Ham cevabı konsola yazdır
-        print(f"[FLOW DEBUG] Ham result tipi: {type(result)}")
-        print(f"[FLOW DEBUG] Ham result: {result}")
+        # Ham cevap yalnızca DEBUG seviyesinde loglanır (format tembel yapılır)
+        logger.debug("[FLOW DEBUG] Ham result tipi: %s", type(result))
+        logger.debug("[FLOW DEBUG] Ham result: %r", result)
         
         # Gemini ve OpenAI çıktılarını normalize et
         if hasattr(result, 'content'):
             # LangChain response objesi
             text = result.content
-            print(f"[FLOW DEBUG] Content: {text}")
+            logger.debug("[FLOW DEBUG] Content: %s", text)
         elif isinstance(result, str):
             # String çıktı
             text = result
-            print(f"[FLOW DEBUG] String: {text}")
+            logger.debug("[FLOW DEBUG] String: %s", text)
         else:
             # Diğer durumlar için string'e çevir
             text = str(result)
-            print(f"[FLOW DEBUG] String'e çevriliyor: {text}")
+            logger.debug("[FLOW DEBUG] String'e çevriliyor: %s", text)
         
         # FlowDecisionParser'ı kullan
-        parser = FlowDecisionParser()
-        parsed_result = parser.parse(text)
-        print(f"[FLOW DEBUG] Parsed result: {parsed_result}")
+        parsed_result = _FLOW_PARSER.parse(text)
+        logger.debug("[FLOW DEBUG] Parsed result: %s", parsed_result)
         return parsed_result
+
+    def flow_processor(input_data):
+        """Flow decision işleyicisi - Gemini ve OpenAI çıktılarını normalize eder"""
+        normalized_input = collapse_whitespace(str(input_data.get("input", ""))).lower()
+        ttl_bucket = int(time.monotonic() // FLOW_CACHE_TTL)
+        return cached_flow_decision(normalized_input, ttl_bucket)
     
     return flow_processor
 
@@ -337,89 +1006,111 @@ def create_rag_chain():
     """RAG chain'i oluşturur - ConversationSummaryBufferMemory ile"""
     # Memory ile kullanırken sadece tek input variable kullan - chat_history otomatik eklenir
     # Context bilgisi prompt'a dahil edilir, memory sistemi konuşma geçmişini yönetir
-    rag_prompt = PromptTemplate(
-        input_variables=["input"],
-        template="""Sen bir hayvan bakımı bilgi asistanısın. Verilen BAĞLAM (PDF parçaları) üzerinden
-kullanıcının sorusunu YALNIZCA bağlama dayanarak yanıtla. Türkçe, kısa, net ve uygulanabilir yaz.
-
-Kesin kurallar:
-1) Doğrudan yanıt ver; bölüm/başlık/"git oku" tarzı yönlendirmeler yapma.
-2) Bağlamdaki bilgileri özlü maddeler halinde veya kısa paragraflarla aktar.
-3) Kaynak ve alıntı isimlerini yazma; sadece içerik ver.
-4) Bağlam yeterli değilse bunu açıkça söyle: "Bağlamda yeterli bilgi yok."
-5) JSON üretme; normal metin ver. Maksimum 5 cümle.
-
-SORU VE BAĞLAM: {input}
-
-YANIT:"""
-    )
-    
-    def rag_processor(input_data):
-        """RAG işleyicisi - Gemini ve OpenAI çıktılarını normalize eder"""
-        result = (rag_prompt | llm).invoke(input_data)
+    def rag_processor(input_data, on_token: Callable[[str], None] | None = None):
+        """RAG işleyicisi - Gemini ve OpenAI çıktılarını normalize eder.
+
+        `on_token` verilirse yanıt stream edilir ve her parça bu callback'e iletilir.
+        """
+        # Önceden ayrılmış şablon parçalarıyla prompt tek birleştirmede kurulur
+        prompt = _RAG_PREFIX + input_data["input"] + _RAG_SUFFIX
+        if on_token is not None:
+            parts: list[str] = []
+            for chunk in chain_llm.stream(prompt):
+                piece = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if piece:
+                    parts.append(piece)
+                    on_token(piece)
+            streamed = "".join(parts)
+            logger.debug("[RAG DEBUG] Stream tamamlandı: %s", streamed)
+            return streamed
+
+        result = chain_llm.invoke(prompt)
         
-        # Ham cevabı konsola yazdır
-        print(f"[RAG DEBUG] Ham result tipi: {type(result)}")
-        print(f"[RAG DEBUG] Ham result: {result}")
+        # Ham cevap yalnızca DEBUG seviyesinde loglanır (format tembel yapılır)
+        logger.debug("[RAG DEBUG] Ham result tipi: %s", type(result))
+        logger.debug("[RAG DEBUG] Ham result: %r", result)
         
         # Gemini ve OpenAI çıktılarını normalize et
         if hasattr(result, 'content'):
             # LangChain response objesi
-            print(f"[RAG DEBUG] Content: {result.content}")
+            logger.debug("[RAG DEBUG] Content: %s", result.content)
             return result.content
         elif isinstance(result, str):
             # String çıktı
-            print(f"[RAG DEBUG] String: {result}")
+            logger.debug("[RAG DEBUG] String: %s", result)
             return result
         else:
             # Diğer durumlar için string'e çevir
-            print(f"[RAG DEBUG] String'e çevriliyor: {str(result)}")
+            logger.debug("[RAG DEBUG] String'e çevriliyor: %s", result)
             return str(result)
     
     return rag_processor
 
 
+def _parse_fused_output(text: str) -> tuple[str, str | None]:
+    """Birleşik prompt çıktısından (akış, RAG yanıtı) çıkarır; JSON bozuksa sadece akışı okur"""
+    cleaned = text.replace("```json", "").replace("```", "").strip()
+    start, end = cleaned.find("{"), cleaned.rfind("}")
+    if start != -1 and end > start:
+        try:
+            data = json.loads(cleaned[start:end + 1])
+            if isinstance(data, dict):
+                flow = _FLOW_PARSER.parse(str(data.get("flow", "")))
+                answer = str(data.get("answer") or "").strip()
+                return flow, (answer if flow == "RAG" and answer else None)
+        except Exception:
+            pass
+    return _FLOW_PARSER.parse(text), None
+
+
+def create_fused_rag_decision_chain():
+    """Akış kararı + RAG yanıtını tek LLM çağrısında üreten chain'i oluşturur.
+
+    RAG ipucu taşıyan mesajlarda bağlam önceden çekilir; ayrı akış kararı ve RAG
+    çağrısı yerine tek istek atılır (bir tam LLM gidiş-dönüşü tasarruf edilir).
+    """
+    def fused_processor(user_message: str, context: str) -> tuple[str, str | None]:
+        """Birleşik çağrıyı yapar - Gemini ve OpenAI çıktılarını normalize eder"""
+        result = chain_llm.invoke(_FUSED_TEMPLATE.format(input=user_message, context=context))
+        text = result.content if hasattr(result, 'content') else str(result)
+        logger.debug("[FUSED DEBUG] Ham result: %s", text)
+        flow, answer = _parse_fused_output(text)
+        logger.debug("[FUSED DEBUG] Parsed flow: %s", flow)
+        return flow, answer
+
+    return fused_processor
+
+
 def create_animal_chain():
     """Animal chain'i oluşturur - API çağrısı yapar - ConversationSummaryBufferMemory ile"""
-    def animal_processor(user_message: str) -> Dict[str, Any]:
+    async def animal_processor(user_message: str, prefetched: asyncio.Task | None = None) -> Dict[str, Any]:
         """Hayvan API'sini çağırır ve sonucu döndürür - memory sistemi ile timeout handling"""
         # Hayvan API'leri için timeout ve hata yönetimi
         # Memory sistemi ile konuşma geçmişi otomatik olarak yönetiliyor
         try:
             print("[ANIMAL CHAIN] Hayvan API'si çağrılıyor...")
-            # OpenAI client oluştur - route_animals client bekliyor
-            from openai import OpenAI
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            animal_result = route_animals(user_message, client)
+            # Spekülatif olarak başlatılmış istek varsa onun sonucunu kullan
+            animal_result = await (prefetched if prefetched is not None else _fetch_animal(user_message))
             
             if animal_result:
                 animal = str(animal_result.get("animal", ""))
+                emoji = _animal_emoji(animal)
                 out: Dict[str, Any] = {
                     "animal": animal,
                     "type": animal_result.get("type"),
-                    "animal_emoji": _animal_emoji(animal),
+                    "animal_emoji": emoji,
                 }
                 if animal_result.get("type") == "image":
                     out["image_url"] = animal_result.get("image_url")
-                    out["response"] = f"{_animal_emoji(animal)} {animal.capitalize()} fotoğrafı hazır."
+                    out["response"] = f"{emoji} {animal.capitalize()} fotoğrafı hazır."
                 else:
                     out["response"] = animal_result.get("text", "")
                 
-                # Memory'ye animal yanıtını kaydet
-                memory.save_context(
-                    {"input": user_message},
-                    {"output": out["response"]}
-                )
-                
                 print(f"[ANIMAL CHAIN] Başarılı: {animal}")
                 return out
             
-            # Hayvan bulunamadı durumu için de memory'ye kaydet
+            # Hayvan bulunamadı durumu (memory kaydı ChatPipeline.process'te yapılır)
             error_response = "Hayvan bulunamadı."
-            memory.save_context(
-                {"input": user_message},
-                {"output": error_response}
-            )
             print("[ANIMAL CHAIN] Hayvan bulunamadı")
             return {"response": error_response}
             
@@ -427,55 +1118,59 @@ def create_animal_chain():
             print(f"[ANIMAL CHAIN] Hata: {e}")
             # Timeout veya API hatası durumunda fallback yanıt
             error_response = "Hayvan API'si şu anda kullanılamıyor. Lütfen daha sonra tekrar deneyin."
-            memory.save_context(
-                {"input": user_message},
-                {"output": error_response}
-            )
             return {"response": error_response}
     
     return animal_processor
 
 
+async def _fetch_animal(user_message: str) -> dict | None:
+    """Paylaşılan OpenAI client ile hayvan yönlendirmesini çalıştırır (memory'ye yazmaz)"""
+    return await route_animals(user_message, get_async_openai_client())
+
+
+def _discard_task(task: asyncio.Task | None) -> None:
+    """Kullanılmayan spekülatif görevi iptal eder; olası hatasını sessizce tüketir"""
+    if task is None:
+        return
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
 def create_emotion_chain():
     """Emotion chain'i oluşturur - ConversationSummaryBufferMemory ile"""
-    def emotion_processor(user_message: str) -> Dict[str, Any]:
+    async def emotion_processor(
+        user_message: str, on_token: Callable[[str], None] | None = None
+    ) -> Dict[str, Any]:
         """Duygu analizi yapar - memory sistemi ile"""
         # Emotion sistemi için OpenAI client oluşturma
         # Memory sistemi ile konuşma geçmişi otomatik olarak yönetiliyor
         global chatbot_instance
         if chatbot_instance is None:
-            # Fallback mekanizması ile client oluştur
-            try:
-                from openai import OpenAI
-                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                # Test çağrısı yap
-                client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": "test"}],
-                    max_tokens=1
-                )
-                chatbot_instance = EmotionChatbot(client)
+            # Sağlayıcı API key varlığına göre seçilir (test çağrısı yapılmaz)
+            if os.getenv("OPENAI_API_KEY"):
+                chatbot_instance = EmotionChatbot(get_async_openai_client())
                 print("[EMOTION] OpenAI API kullanılıyor")
-            except Exception as e:
-                print(f"[EMOTION] OpenAI API hatası: {e}")
-                # Gemini kullan
+            else:
                 chatbot_instance = EmotionChatbot()  # client=None, Gemini kullanacak
                 print("[EMOTION] Gemini API kullanılıyor")
         
         # Memory sistemi ile önceki konuşma geçmişi otomatik olarak yönetiliyor
-        
-        result = chatbot_instance.chat(user_message)
+        # request_debug metni yalnızca LOG_LEVEL=DEBUG iken üretilir
+        debug = logger.isEnabledFor(logging.DEBUG)
+        try:
+            result = await chatbot_instance.chat(user_message, on_token, debug)
+        except LLM_FALLBACK_ERRORS as e:
+            # OpenAI ilk gerçek çağrıda başarısızsa Gemini'ye geç ve bir kez tekrar dene
+            if chatbot_instance.use_gemini or not os.getenv("GEMINI_API_KEY"):
+                raise
+            print(f"[EMOTION] OpenAI API hatası: {e} - Gemini API'ye geçiliyor")
+            chatbot_instance.switch_to_gemini()
+            result = await chatbot_instance.chat(user_message, on_token, debug)
         stats = {
             "requests": chatbot_instance.stats["requests"],
             "last_request_at": chatbot_instance.stats["last_request_at"],
         }
         
-        # Memory'ye yeni konuşmayı kaydet
-        memory.save_context(
-            {"input": user_message},
-            {"output": result.get("response", "")}
-        )
-        
         out = {"response": result.get("response", ""), "stats": stats}
         if "first_emoji" in result:
             out["first_emoji"] = result["first_emoji"]
@@ -494,14 +1189,9 @@ def create_stats_chain():
 
     def stats_processor(user_message: str) -> Dict[str, Any]:
         try:
-            result = stats_system.answer(user_message)
-            # Memory'ye kaydet
-            memory.save_context({"input": user_message}, {"output": result.get("response", "")})
-            return result
+            return stats_system.answer(user_message)
         except Exception as e:
-            err = f"İstatistik sistemi hatası: {e}"
-            memory.save_context({"input": user_message}, {"output": err})
-            return {"response": err}
+            return {"response": f"İstatistik sistemi hatası: {e}"}
 
     return stats_processor
 
@@ -509,145 +1199,229 @@ def create_stats_chain():
 # CHAIN SYSTEM - Ana İşlem Zinciri
 # =============================================================================
 
-def create_main_processing_chain():
-    """Ana işlem zinciri oluşturur"""
-    
-    # Alt chain'leri oluştur
-    flow_decision_chain = create_flow_decision_chain()
-    rag_chain = create_rag_chain()
-    animal_processor = create_animal_chain()
-    emotion_processor = create_emotion_chain()
-    stats_processor = create_stats_chain()
-    
-    def process_message(user_message: str) -> Dict[str, Any]:
-        """Ana mesaj işleme fonksiyonu - ConversationSummaryBufferMemory ile"""
+class ChatPipeline:
+    """Ana işlem zinciri - alt chain'leri bir kez oluşturur ve mesajları işler.
+
+    Her uvicorn worker süreci tek bir örnek oluşturur (startup'ta); istekler bu
+    örneği paylaşır.
+    """
+
+    __slots__ = ("flow", "rag", "fused", "animal", "emotion", "stats")
+
+    def __init__(self) -> None:
+        # Alt chain'leri oluştur
+        self.flow = create_flow_decision_chain()
+        self.rag = create_rag_chain()
+        self.fused = create_fused_rag_decision_chain()
+        self.animal = create_animal_chain()
+        self.emotion = create_emotion_chain()
+        self.stats = create_stats_chain()
+
+    async def process(
+        self,
+        ctx: MessageContext,
+        on_token: Callable[[str], None] | None = None,
+        on_flow: Callable[[str], None] | None = None,
+    ) -> Dict[str, Any]:
+        """Ana mesaj işleme fonksiyonu - ConversationSummaryBufferMemory ile.
+
+        `on_token` verilirse RAG/duygu yanıtı üretilirken parça parça bu callback'e iletilir;
+        `on_flow` verilirse akış kararı alınır alınmaz bildirilir.
+        Konuşma memory'ye burada, istek başına tek kez kaydedilir (alt chain'ler yazmaz).
+        """
+        result = await self._dispatch(ctx, on_token, on_flow)
+        if "error" not in result:
+            memory_writer.append(ctx.text, result.get("response", ""))
+        return result
+
+    async def _dispatch(
+        self,
+        ctx: MessageContext,
+        on_token: Callable[[str], None] | None,
+        on_flow: Callable[[str], None] | None,
+    ) -> Dict[str, Any]:
+        """Akış kararını alır ve mesajı ilgili alt chain'e yönlendirir"""
+        user_message = ctx.text
         try:
             print("[CHAIN SYSTEM] AŞAMA 1: Akış kararı alınıyor...")
             
             # Memory sistemi aktif - ConversationSummaryBufferMemory ile konuşma geçmişi yönetiliyor
             
-            # AŞAMA 1: Akış kararı
-            flow_decision = flow_decision_chain({"input": user_message})
+            # AŞAMA 1: Akış kararı - önce anahtar kelime, belirsizse LLM
+            speculative_animal: asyncio.Task | None = None
+            retrieved: tuple[list[Dict[str, Any]], str | None] | None = None
+            rag_answer: str | None = None
+            hints = ctx.hints
+            flow_decision = _keyword_flow_decision(hints) or _short_message_flow(user_message, hints)
+            if flow_decision:
+                print("[CHAIN SYSTEM] Akış kararı yerel sınıflandırıcıdan alındı (LLM atlandı)")
+            else:
+                # Hayvan + istek türü anahtar kelimeyle eşleşiyorsa (LLM gerektirmez) hayvan
+                # isteği akış kararı beklenirken başlatılır; aksi halde karar beklenir
+                # (function calling isteği boşa gönderilmesin)
+                if hints["animal_function"]:
+                    speculative_animal = asyncio.create_task(_fetch_animal(user_message))
+                try:
+                    if hints["rag_alias"]:
+                        # Kaynak (kedi/papağan/tavşan) ipucu: bağlamı önce çek, akış kararı + yanıtı
+                        # tek çağrıda al. Yalnızca konu kelimesi ("eğitim", "food") tek başına
+                        # yetmez; bu mesajlar önbellekli akış kararından geçer
+                        await _wait_rag_ready()
+                        retrieved = await run_in_threadpool(_retrieve_rag_chunks, user_message, hints["rag_alias"])
+                        if retrieved[0]:
+                            flow_decision, rag_answer = await run_in_threadpool(
+                                self.fused, user_message, _build_rag_context(retrieved[0])
+                            )
+                    if not flow_decision and retrieved is None and _rag_ready.is_set():
+                        # Belirsiz mesaj: LLM akış kararı beklenirken genel RAG bağlamı paralel çekilir;
+                        # karar RAG çıkarsa retrieval beklemesi ortadan kalkar
+                        flow_decision, retrieved = await asyncio.gather(
+                            run_in_threadpool(self.flow, {"input": user_message}),
+                            run_in_threadpool(_try_retrieve_rag_chunks, user_message),
+                        )
+                    elif not flow_decision:
+                        flow_decision = await run_in_threadpool(self.flow, {"input": user_message})
+                except Exception:
+                    _discard_task(speculative_animal)
+                    raise
+                if flow_decision != "ANIMAL":
+                    _discard_task(speculative_animal)
+                    speculative_animal = None
             print(f"[CHAIN SYSTEM] Akış kararı: {flow_decision}")
+            if on_flow is not None:
+                on_flow(flow_decision)
             
             # AŞAMA 2: Seçilen akışa göre işleme
             if flow_decision == "RAG":
                 print("[CHAIN SYSTEM] AŞAMA 2: RAG akışı çalışıyor...")
-                rag_result = _process_rag_flow(user_message, rag_chain)
+                if retrieved is None:
+                    await _wait_rag_ready()
+                    retrieved = await run_in_threadpool(_retrieve_rag_chunks, user_message, hints["rag_alias"])
+                rag_result = await run_in_threadpool(
+                    _process_rag_flow, user_message, self.rag, retrieved, rag_answer, on_token
+                )
                 if rag_result is None:
                     print("[CHAIN SYSTEM] RAG sonucu None, HELP akışına yönlendiriliyor...")
                     help_result = _process_help_flow(user_message)
                     help_result["flow_type"] = "HELP"
+                    # Geçici durum (RAG hazır değil / retrieval hatası) önbelleğe alınmasın
+                    help_result["rag_fallback"] = True
                     return help_result
                 rag_result["flow_type"] = "RAG"
                 return rag_result
             elif flow_decision == "ANIMAL":
                 print("[CHAIN SYSTEM] AŞAMA 2: Animal akışı çalışıyor...")
-                animal_result = animal_processor(user_message)
+                animal_result = await self.animal(user_message, speculative_animal)
                 animal_result["flow_type"] = "ANIMAL"
                 return animal_result
             elif flow_decision == "EMOTION":
                 print("[CHAIN SYSTEM] AŞAMA 2: Emotion akışı çalışıyor...")
-                emotion_result = emotion_processor(user_message)
+                # Uzun duygu mesajları özetlenir; RAG/STATS/ANIMAL orijinal metinle çalışır
+                # (özet niyeti bozabilir ve bu akışlar için T5 çağrısı gereksizdir)
+                emotion_message = user_message
+                if ctx.tokens > SUMMARIZE_TOKEN_THRESHOLD:
+                    emotion_message = await summarizer_batcher.submit(user_message)
+                emotion_result = await self.emotion(emotion_message, on_token)
                 emotion_result["flow_type"] = "EMOTION"
                 return emotion_result
             elif flow_decision == "STATS":
                 print("[CHAIN SYSTEM] AŞAMA 2: Stats akışı çalışıyor...")
-                stats_result = stats_processor(user_message)
+                stats_result = await run_in_threadpool(self.stats, user_message)
                 stats_result["flow_type"] = "STATS"
                 return stats_result
             elif flow_decision == "HELP":
                 print("[CHAIN SYSTEM] AŞAMA 2: Help akışı çalışıyor...")
                 result = _process_help_flow(user_message)
                 result["flow_type"] = "HELP"
-                print(f"[CHAIN SYSTEM] Help result: {result}")
+                logger.debug("[CHAIN SYSTEM] Help result: %r", result)
                 return result
             else:
                 print("[CHAIN SYSTEM] Fallback: Help akışı çalışıyor...")
                 result = _process_help_flow(user_message)
                 result["flow_type"] = "HELP"
-                print(f"[CHAIN SYSTEM] Fallback result: {result}")
+                logger.debug("[CHAIN SYSTEM] Fallback result: %r", result)
                 return result
                 
         except Exception as e:
             print(f"[CHAIN SYSTEM] Hata: {e}")
             return {"error": str(e)}
-    
-    return process_message
 
 
-def _process_rag_flow(user_message: str, rag_chain) -> Dict[str, Any] | None:
-    """RAG akışını işler - PDF'lerden bilgi çeker"""
-    t = user_message.lower()
-    
+def _retrieve_rag_chunks(user_message: str, rag_alias: str | None) -> tuple[list[Dict[str, Any]], str | None]:
+    """RAG için ilgili PDF parçalarını çeker; (parçalar, açık kaynak) döndürür.
+
+    `rag_alias`, _scan_keywords ile mesajdan bulunan kaynak takma adıdır (cat/parrot/rabbit).
+    """
     # Heuristic: explicit source keywords (hayvan bakım)
-    if ("kedi" in t or "cat" in t):
-        source = "cat_care.pdf"
-    elif ("papağan" in t or "parrot" in t or "kuş" in t):
-        source = "parrot_care.pdf"
-    elif ("tavşan" in t or "rabbit" in t):
-        source = "rabbit_care.pdf"
-    else:
+    if not rag_alias:
         # LLM RAG seçtiyse anahtar kelime kontrolü yapmadan genel retrieval dene
-        chunks = rag_service.retrieve_top(user_message, top_k=6)
-        if not chunks:
-            print("[RAG] RAG'de ilgili bilgi bulunamadı")
-            return None
-        context = "\n\n".join([c.get("text", "") for c in chunks])
-        sources = list({(c.get("metadata", {}) or {}).get("source", "?") for c in chunks})
-        
-        # RAG chain ile işle - context'i prompt'a dahil et
-        combined_input = f"BAĞLAM:\n{context}\n\nSORU: {user_message}"
-        result = rag_chain({"input": combined_input})
-        
-        # Memory'ye RAG yanıtını kaydet
-        memory.save_context(
-            {"input": user_message},
-            {"output": result if isinstance(result, str) else str(result)}
-        )
-        
-        # Pick first known source for UI hint
-        lit = None
-        for s in sources:
-            if s in RAG_SOURCES:
-                lit = s
-                break
-        ui = RAG_SOURCES.get(lit or "", None)
-        return {
-            "rag": True,
-            "response": result if isinstance(result, str) else str(result),
-            "rag_source": ui.get("id") if ui else None,
-            "rag_emoji": ui.get("emoji") if ui else None,
-        }
+        return rag_service.retrieve_top(user_message, top_k=6), None
+    source = _RAG_SOURCE_BY_ALIAS[rag_alias]
 
     # Source-filtered retrieval
-    chunks = rag_service.retrieve_by_source(user_message, source_filename=source, top_k=6)
+    return rag_service.retrieve_by_source(user_message, source_filename=source, top_k=6), source
+
+
+def _try_retrieve_rag_chunks(user_message: str) -> tuple[list[Dict[str, Any]], str | None] | None:
+    """Spekülatif genel retrieval; hata olursa None döner (RAG seçilirse tekrar denenir)"""
+    try:
+        return _retrieve_rag_chunks(user_message, None)
+    except Exception as e:
+        print(f"[RAG] Spekülatif retrieval başarısız: {e}")
+        return None
+
+
+def _build_rag_context(chunks: list[Dict[str, Any]]) -> str:
+    """PDF parçalarını prompt bağlamı olarak birleştirir"""
+    return "\n\n".join([c.get("text", "") for c in chunks])
+
+
+def _process_rag_flow(
+    user_message: str,
+    rag_chain,
+    retrieved: tuple[list[Dict[str, Any]], str | None],
+    answer: str | None = None,
+    on_token: Callable[[str], None] | None = None,
+) -> Dict[str, Any] | None:
+    """RAG akışını işler - çekilmiş PDF parçalarından yanıt üretir.
+
+    Birleşik çağrıdan gelen yanıt (`answer`) verilirse RAG chain tekrar
+    çağrılmaz. `on_token` verilirse RAG yanıtı stream edilir. Yanıtlar yalnızca
+    endpoint seviyesindeki yanıt önbelleğinde tutulur (bkz. _response_cache_put).
+    """
+    chunks, source = retrieved
     if not chunks:
+        print("[RAG] RAG'de ilgili bilgi bulunamadı")
         return None
-    context = "\n\n".join([c.get("text", "") for c in chunks])
-    
-    # RAG chain ile işle - context'i prompt'a dahil et
-    combined_input = f"BAĞLAM:\n{context}\n\nSORU: {user_message}"
-    result = rag_chain({"input": combined_input})
     
-    # Memory'ye RAG yanıtını kaydet
-    memory.save_context(
-        {"input": user_message},
-        {"output": result if isinstance(result, str) else str(result)}
-    )
+    if answer is not None:
+        result = answer
+    else:
+        # RAG chain ile işle - context'i prompt'a dahil et
+        combined_input = f"BAĞLAM:\n{_build_rag_context(chunks)}\n\nSORU: {user_message}"
+        result = rag_chain({"input": combined_input}, on_token)
     
-    ui = RAG_SOURCES.get(source)
+    if source is None:
+        # UI ipucu için en iyi eşleşen parçadan başlayarak ilk bilinen kaynağı seç
+        # (ara küme/liste kurulmaz; sonuç sıralamaya göre deterministiktir)
+        source = next(
+            (
+                s for s in ((c.get("metadata") or {}).get("source") for c in chunks)
+                if s in RAG_SOURCES
+            ),
+            None,
+        )
+    ui = RAG_SOURCES.get(source or "", None)
     return {
         "rag": True,
         "response": result if isinstance(result, str) else str(result),
-        "rag_source": ui.get("id"),
-        "rag_emoji": ui.get("emoji"),
+        "rag_source": ui.get("id") if ui else None,
+        "rag_emoji": ui.get("emoji") if ui else None,
     }
 
 
-def _process_help_flow(user_message: str) -> Dict[str, Any]:
-    """Help akışını işler - kullanıcıya yönlendirici mesaj verir"""
-    help_message = """🤖 Merhaba! Ben akıllı bir chatbot'um ve size şu özelliklerle yardımcı olabilirim:
+# Yardım akışının sabit yanıtı (modül yüklenirken bir kez oluşturulur)
+HELP_MESSAGE = """🤖 Merhaba! Ben akıllı bir chatbot'um ve size şu özelliklerle yardımcı olabilirim:
 
 📚 **BİLGİ SİSTEMİ (RAG)**: 
 • Kedi / Papağan / Tavşan bakımı (beslenme, barınma, sağlık, eğitim)
@@ -662,81 +1436,206 @@ def _process_help_flow(user_message: str) -> Dict[str, Any]:
 • "Bugün çok mutluyum", "Üzgün hissediyorum" gibi mesajlar
 
 🎯 **KULLANIM**: Ekranda gördüğünüz kutucukları kullanarak veya yukarıdaki örnekler gibi mesajlar göndererek bu chatbot'u kullanabilirsiniz!"""
-    
-    # Memory'ye help yanıtını kaydet
-    memory.save_context(
-        {"input": user_message},
-        {"output": help_message}
-    )
-    
+
+
+def _process_help_flow(user_message: str) -> Dict[str, Any]:
+    """Help akışını işler - kullanıcıya yönlendirici mesaj verir.
+
+    Bloklamaz (sabit yanıt döner); event loop'tan doğrudan çağrılabilir.
+    """
     return {
         "help": True,
-        "response": help_message
+        "response": HELP_MESSAGE
     }
 
 
-# Ana chain'i oluştur
-main_chain = create_main_processing_chain()
+# Ana chain worker başlarken oluşturulur (bkz. _init_pipeline)
+main_chain: ChatPipeline | None = None
+
+
+def _get_pipeline() -> ChatPipeline:
+    """Süreç başına tek ChatPipeline örneğini döndürür (startup çalışmadıysa oluşturur)"""
+    global main_chain
+    if main_chain is None:
+        main_chain = ChatPipeline()
+    return main_chain
 
 
 # =============================================================================
 # FASTAPI ENDPOINTS
 # =============================================================================
 
+INDEX_TEMPLATE_PATH = Path(__file__).parent / "templates" / "index.html"
+
+
+@lru_cache(maxsize=1)
+def _load_index_html() -> bytes:
+    """Ana sayfa HTML'ini diskten bir kez okur; sonraki istekler bellekten döner"""
+    return INDEX_TEMPLATE_PATH.read_bytes()
+
+
+@app.get("/healthz", response_model=None)
+async def healthz() -> ORJSONResponse:
+    """Hazır olma kontrolü - RAG modeli yüklenene kadar 503 döner"""
+    if not _rag_ready.is_set():
+        return ORJSONResponse({"status": "starting"}, status_code=503)
+    return ORJSONResponse({"status": "ok"})
+
+
 @app.get("/", response_class=HTMLResponse)
-def index() -> HTMLResponse:
+async def index() -> HTMLResponse:
     """Ana sayfa HTML'ini döndürür"""
-    template_path = Path(__file__).parent / "templates" / "index.html"
     try:
-        html = template_path.read_text(encoding="utf-8")
+        html = _load_index_html()
     except Exception as e:
+        # Hata önbelleğe alınmaz; dosya düzeltilince sonraki istek tekrar okur
         raise HTTPException(status_code=500, detail=f"HTML yüklenemedi: {e}")
     return HTMLResponse(content=html)
 
 
-@app.post("/chat")
-def chat(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Ana chat endpoint'i - CHAIN SYSTEM ile akış yönlendirmesi yapar"""
+async def _read_json_payload(request: Request) -> Dict[str, Any]:
+    """İstek gövdesini orjson ile ayrıştırır (JSON obje değilse boş sözlük)"""
+    try:
+        data = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Geçersiz JSON gövdesi")
+    return data if isinstance(data, dict) else {}
+
+
+# İstemci IP -> son istek zamanları (kayan pencere; LRU ile sınırlı)
+_rate_limit_hits: "OrderedDict[str, deque[float]]" = OrderedDict()
+
+
+async def _enforce_rate_limit(request: Request) -> None:
+    """İstemci başına chat isteklerini sınırlar; aşılırsa 429 döner"""
+    client = request.client.host if request.client else "unknown"
+    now = time.monotonic()
+    hits = _rate_limit_hits.get(client)
+    if hits is None:
+        hits = _rate_limit_hits[client] = deque()
+        if len(_rate_limit_hits) > RATE_LIMIT_MAX_CLIENTS:
+            _rate_limit_hits.popitem(last=False)
+    else:
+        _rate_limit_hits.move_to_end(client)
+    while hits and hits[0] <= now - CHAT_RATE_WINDOW:
+        hits.popleft()
+    if len(hits) >= CHAT_RATE_LIMIT:
+        print(f"[CHAIN SYSTEM] Hız sınırı aşıldı: {client}")
+        retry_after = int(hits[0] + CHAT_RATE_WINDOW - now) + 1
+        raise HTTPException(
+            status_code=429,
+            detail="Çok fazla istek. Lütfen biraz sonra tekrar deneyin.",
+            headers={"Retry-After": str(retry_after)},
+        )
+    hits.append(now)
+
+
+async def _prepare_user_message(payload: Dict[str, Any]) -> tuple[MessageContext | None, str | None]:
+    """Gelen mesajı doğrular, temizler ve gerekirse özetler; (bağlam, hata) döndürür"""
     user_message = str(payload.get("message", "")).strip()
     
     # Güvenlik kontrolleri
     if not user_message:
-        return {"error": "Mesaj boş olamaz"}
+        return None, "Mesaj boş olamaz"
     
     # Mesaj uzunluk kontrolü
     if not _validate_message_length(user_message):
-        return {"error": f"Mesaj çok uzun. Maksimum {MAX_MESSAGE_LENGTH} karakter olabilir."}
+        return None, f"Mesaj çok uzun. Maksimum {MAX_MESSAGE_LENGTH} karakter olabilir."
     
     # Input sanitization
-    user_message = _sanitize_input(user_message)
-    if user_message == "[Güvenlik nedeniyle mesaj filtrelendi]":
-        return {"error": "Güvenlik nedeniyle mesaj filtrelendi"}
+    user_message = sanitize(user_message)
+    if user_message == FILTERED_MESSAGE:
+        return None, "Güvenlik nedeniyle mesaj filtrelendi"
     
     # Token kontrolü
     estimated_tokens = _estimate_tokens(user_message)
-    # 200+ token ise önce özetlemeyi dene (kaba tahmin üzerinden)
-    user_message = _summarize_text_if_needed(user_message, estimated_tokens, token_threshold=200)
-    # Özet sonrası yeniden tahmini token sayısı al (sert limit için paylaşımcı davranış)
-    estimated_tokens = _estimate_tokens(user_message)
+    # Özetleme akışa bağlıdır (bkz. ChatPipeline._dispatch); burada yalnızca token
+    # limitini aşan mesajlar limite sığdırılmak için özetlenir
+    if estimated_tokens > MAX_TOKENS_PER_REQUEST:
+        summarized = await summarizer_batcher.submit(user_message)
+        # Token tahmini yalnızca özetleyici metni değiştirdiyse yeniden hesaplanır
+        if summarized != user_message:
+            user_message = summarized
+            estimated_tokens = _estimate_tokens(user_message)
     if estimated_tokens > MAX_TOKENS_PER_REQUEST:
-        return {"error": f"Çok fazla token. Maksimum {MAX_TOKENS_PER_REQUEST} token olabilir."}
+        return None, f"Çok fazla token. Maksimum {MAX_TOKENS_PER_REQUEST} token olabilir."
+    return MessageContext(text=user_message, tokens=estimated_tokens), None
+
+
+def _finalize_chain_result(result: Any) -> Dict[str, Any]:
+    """Chain sonucunu kontrol eder; hatalı/geçersiz sonuçları hata yanıtına çevirir"""
+    # Result'u kontrol et ve hata varsa düzelt
+    if isinstance(result, dict) and "error" in result:
+        print(f"[CHAIN SYSTEM] Hata tespit edildi: {result['error']}")
+        return {"error": result["error"]}
+    
+    # Result'un geçerli olduğundan emin ol
+    if not isinstance(result, dict):
+        print(f"[CHAIN SYSTEM] Geçersiz result tipi: {type(result)}")
+        return {"error": "Geçersiz response formatı"}
+        
+    logger.debug("[CHAIN SYSTEM] Başarılı response: %r", result)
+    return result
+
+
+# Endpoint seviyesinde yanıt önbelleği: normalize mesaj özeti -> (son geçerlilik, sonuç).
+# Sadece event loop içinden erişilir, kilit gerekmez.
+_response_cache: "OrderedDict[bytes, tuple[float, Dict[str, Any]]]" = OrderedDict()
+_upstream_semaphore = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+
+
+def _response_cache_key(text: str) -> bytes:
+    """Mesajı ortak normalizasyondan geçirip (bkz. security.normalize_cache_text) özetler"""
+    return hashlib.blake2b(normalize_cache_text(text).encode("utf-8"), digest_size=16).digest()
+
+
+def _response_cache_get(key: bytes) -> Dict[str, Any] | None:
+    """Süresi geçmemiş önbellek kaydını döndürür"""
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return dict(entry[1])
+
 
+def _response_cache_put(key: bytes, result: Dict[str, Any]) -> None:
+    """Önbelleğe alınabilir akış sonucunu saklar; kapasite aşılırsa en eskiyi siler.
+
+    RAG'den HELP'e düşülen sonuçlar ve bağlam yetersiz RAG yanıtları saklanmaz.
+    """
+    if "error" in result or result.get("flow_type") not in RESPONSE_CACHEABLE_FLOWS:
+        return
+    if result.get("rag_fallback") or RAG_NO_CONTEXT_MARKER in str(result.get("response", "")):
+        return
+    _response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, dict(result))
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > RESPONSE_CACHE_MAXSIZE:
+        _response_cache.popitem(last=False)
+
+
+async def _run_main_chain(
+    ctx: MessageContext,
+    on_token: Callable[[str], None] | None = None,
+    on_flow: Callable[[str], None] | None = None,
+) -> Dict[str, Any]:
+    """Ana chain'i çalıştırır ve sonucu endpoint'e uygun hale getirir"""
+    cache_key = _response_cache_key(ctx.text)
+    cached = _response_cache_get(cache_key)
+    if cached is not None:
+        print("[CHAIN SYSTEM] Yanıt önbellekten döndü (chain atlandı)")
+        return cached
     try:
         # CHAIN SYSTEM ile mesaj işleme
         print("[CHAIN SYSTEM] Mesaj işleniyor...")
-        result = main_chain(user_message)
-        
-        # Result'u kontrol et ve hata varsa düzelt
-        if isinstance(result, dict) and "error" in result:
-            print(f"[CHAIN SYSTEM] Hata tespit edildi: {result['error']}")
-            return {"error": result["error"]}
-        
-        # Result'un geçerli olduğundan emin ol
-        if not isinstance(result, dict):
-            print(f"[CHAIN SYSTEM] Geçersiz result tipi: {type(result)}")
-            return {"error": "Geçersiz response formatı"}
-            
-        print(f"[CHAIN SYSTEM] Başarılı response: {result}")
+        # Yoğunlukta upstream'e (OpenAI/Gemini/hayvan API'leri) giden eşzamanlı chain sayısı
+        # sınırlanır; fazlası hata yerine sırada bekler
+        async with _upstream_semaphore:
+            result = await _get_pipeline().process(ctx, on_token, on_flow)
+        result = _finalize_chain_result(result)
+        _response_cache_put(cache_key, result)
         return result
 
     except HTTPException as e:
@@ -747,6 +1646,74 @@ def chat(payload: Dict[str, Any]) -> Dict[str, Any]:
         return {"error": f"Sunucu hatası: {str(e)}"}
 
 
+@app.post("/chat", response_model=None, dependencies=[Depends(_enforce_rate_limit)])
+async def chat(payload: Dict[str, Any] = Depends(_read_json_payload)) -> ORJSONResponse:
+    """Ana chat endpoint'i - CHAIN SYSTEM ile akış yönlendirmesi yapar.
+
+    Sonuç doğrudan ORJSONResponse olarak döner; FastAPI'nin response_model
+    doğrulaması ve jsonable_encoder dolaşımı atlanır, gövdeyi tek seferde orjson yazar.
+    """
+    ctx, error = await _prepare_user_message(payload)
+    if error:
+        return ORJSONResponse({"error": error})
+    return ORJSONResponse(await _run_main_chain(ctx))
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Events formatında tek bir olay satırı üretir"""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+@app.post("/chat/stream", dependencies=[Depends(_enforce_rate_limit)])
+async def chat_stream(payload: Dict[str, Any] = Depends(_read_json_payload)) -> StreamingResponse:
+    """Stream chat endpoint'i - RAG/duygu yanıtını üretilirken SSE ile parça parça gönderir.
+
+    Olaylar:
+    - `flow`: {"flow_type": "..."} - akış kararı alınır alınmaz
+    - `token`: {"token": "..."} - RAG yanıtının ya da ham duygu JSON'unun bir parçası
+    - `result`: /chat ile aynı formatta nihai sonuç (tüm akışlar için)
+    """
+    ctx, error = await _prepare_user_message(payload)
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[tuple[str, Dict[str, Any]] | None] = asyncio.Queue()
+
+    def on_token(token: str) -> None:
+        # RAG chain thread havuzunda çalışır; kuyruğa event loop üzerinden yaz
+        loop.call_soon_threadsafe(queue.put_nowait, ("token", {"token": token}))
+
+    def on_flow(flow_type: str) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, ("flow", {"flow_type": flow_type}))
+
+    async def run_chain() -> Dict[str, Any]:
+        try:
+            return await _run_main_chain(ctx, on_token, on_flow)
+        finally:
+            # Kuyruktaki olaylardan sonra işlensin diye sonlandırıcı da aynı yoldan eklenir
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    async def event_stream():
+        if error:
+            yield _sse_event("result", {"error": error})
+            return
+        task = asyncio.create_task(run_chain())
+        try:
+            while (item := await queue.get()) is not None:
+                yield _sse_event(*item)
+            yield _sse_event("result", await task)
+        finally:
+            # İstemci bağlantıyı kapattıysa chain iptal edilir; upstream çağrıları ve
+            # semaphore slotu okunmayan bir kuyruk için tutulmaz
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Proxy'ler (nginx vb.) olayları tamponlamasın ve önbelleğe almasın
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Çalıştırma:
 # uvicorn api_web_chatbot:app --host 0.0.0.0 --port 8000 --reload
 
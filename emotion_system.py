@@ -6,15 +6,23 @@ Bu modül duygu analizi, sohbet ve istatistik işlemlerini yönetir.
 Ana chatbot sınıfı ve duygu işleme fonksiyonlarını içerir.
 """
 
+import atexit
+import contextlib
 import os
 import json
+import orjson
 import random
 import re
+import tempfile
 import html
-from typing import Any, Dict, Optional
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional
 from pathlib import Path
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from security import collapse_whitespace, normalize_cache_text
 
 # Güvenlik sabitleri
 MAX_EMOTION_MESSAGE_LENGTH = 1000
@@ -28,6 +36,11 @@ DANGEROUS_EMOTION_PATTERNS = [
     r'<object[^>]*>',
     r'<embed[^>]*>',
 ]
+# Pattern'ler modül yüklenirken tek bir alternation olarak derlenir (girdi tek taramada
+# kontrol edilir); eşleşen pattern lastindex ile bulunur
+_DANGEROUS_EMOTION_RE = re.compile(
+    "|".join(f"({p})" for p in DANGEROUS_EMOTION_PATTERNS), re.IGNORECASE | re.DOTALL
+)
 
 # Duygu → emoji veri kaynağını yükle (uygulama başında bir kez)
 MOOD_EMOJIS: Dict[str, list[str]] = {}
@@ -49,17 +62,253 @@ try:
 except Exception:
     MOOD_EMOJIS = {}
 
+# Model çıktısındaki duygu adlarını mood_emojis.json anahtarlarına eşler (casefold edilmiş)
+_MOOD_ALIASES = {
+    "utangaç": "Utanmış",
+    "utanmış": "Utanmış",
+    "gülümseyen": "Gülümseyen",
+    "mutlu": "Mutlu",
+    "üzgün": "Üzgün",
+    "öfkeli": "Öfkeli",
+    "şaşkın": "Şaşkın",
+    "endişeli": "Endişeli",
+    "flörtöz": "Flörtöz",
+    "sorgulayıcı": "Sorgulayıcı",
+    "yorgun": "Yorgun",
+}
+# Emoji seçenekleri açılışta bir kez tuple'a çevrilir (boş listeler atlanır)
+_MOOD_EMOJI_OPTIONS: Dict[str, tuple[str, ...]] = {
+    k: tuple(v) for k, v in MOOD_EMOJIS.items() if isinstance(v, list) and v
+}
+_emoji_rand = random.Random()
+
+
+def _normalize_mood(name: str) -> str:
+    """Duygu adını mood_emojis.json anahtarına çevirir (eşleşme yoksa olduğu gibi)"""
+    return _MOOD_ALIASES.get(name.strip().casefold(), name)
+
+
+def _pick_emoji(mood: str) -> Optional[str]:
+    """Duyguya ait emojilerden rastgele birini döndürür (yoksa None)"""
+    options = _MOOD_EMOJI_OPTIONS.get(_normalize_mood(mood))
+    return options[_emoji_rand.randrange(len(options))] if options else None
+
+
+EMOTION_HISTORY_MAXLEN = 6  # EmotionChatbot.messages içinde tutulan son mesaj sayısı
+EMOTION_CACHE_MAXSIZE = 2048  # Duygu yanıtı önbelleği kapasitesi
+EMOTION_CACHE_TTL = 600  # Duygu yanıtı önbelleği süresi (saniye)
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extract_json_object(text: str) -> Dict[str, Any] | None:
+    """Model çıktısındaki ilk JSON objesini çıkarır (code fence'ler temizlenir).
+
+    raw_decode ilk '{' konumundan tek objeyi C tarafında ayrıştırır ve sonrasındaki
+    metni yok sayar; karakter karakter Python döngüsüne gerek kalmaz.
+    """
+    t = text.replace("```json", "").replace("```", "").strip()
+    start = t.find('{')
+    if start == -1:
+        return None
+    try:
+        obj, _ = _JSON_DECODER.raw_decode(t, start)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+# Duygu sistemi prompt'u sabittir; mesaj başına yeniden oluşturulmaz/strip edilmez
+EMOTION_SYSTEM_PROMPT = """
+Sen bir duygu sınıflandırma ve yanıt üretme modelisin.
+Görevin şunlardır:
+
+1. Kullanıcının mesajındaki duyguyu tahmin et.
+2. O duyguya uygun bir ilk cevap yaz.
+3. Ardından ilk duygu ile uyumlu bir ikinci duygu seç; gerekirse aynı duyguyu tekrar seçebilirsin.
+4. Seçilen ikinci duyguya uygun bir ikinci cevap yaz (ilk yanıtla tutarlı olmalıdır).
+5. Çıktıyı Türkçe ver ve her iki yanıt da sadece 1 cümle olmalıdır.
+6. Ek olarak, kullanıcının verdiği mesajdan kullanıcının duygu durumunu tek bir etiket ile belirle.
+6. Çıktıyı her zaman aşağıdaki JSON formatında ver:
+
+{
+  "kullanici_ruh_hali": "...",
+  "ilk_ruh_hali": "...",
+  "ilk_cevap": "...",
+  "ikinci_ruh_hali": "...",
+  "ikinci_cevap": "..."
+}
+
+Seçilebilecek ruh halleri:
+Mutlu, Üzgün, Öfkeli, Şaşkın, Utanmış, Endişeli, Gülümseyen, Flörtöz, Sorgulayıcı, Sorgulayıcı, Yorgun
+""".strip()
+_EMOTION_SYSTEM_MESSAGE = {"role": "system", "content": EMOTION_SYSTEM_PROMPT}
+# Model yanıtında bulunması gereken alanlar (tek bir C seviyesi alt küme kontrolüyle doğrulanır)
+EMOTION_REQUIRED_KEYS = frozenset({"kullanici_ruh_hali", "ilk_ruh_hali", "ilk_cevap", "ikinci_ruh_hali", "ikinci_cevap"})
+
+# Zaman damgası saniyede bir biçimlendirilir; aynı saniyedeki çağrılar önbellekteki string'i kullanır
+_TIMESTAMP_CACHE: tuple[int, str] = (-1, "")
+
+
+def _timestamp() -> str:
+    """Yerel saatle "%Y-%m-%d %H:%M:%S" zaman damgası (saniye başına bir kez strftime)"""
+    global _TIMESTAMP_CACHE
+    sec = int(time.time())
+    cached_sec, cached = _TIMESTAMP_CACHE
+    if sec != cached_sec:
+        cached = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+        _TIMESTAMP_CACHE = (sec, cached)
+    return cached
+
+
+PERSIST_FLUSH_INTERVAL = 1.0  # Geçmiş satırları ve sayaçlar bu aralıkta toplu yazılır (saniye)
+MOOD_COUNTER_LOCK_FILE = DATA_DIR / "mood_counter.lock"
+MOOD_COUNTER_LOCK_TIMEOUT = 10.0  # Kilit bu sürede alınamazsa artışlar bir sonraki yazmaya kalır (saniye)
+
+try:
+    import fcntl  # POSIX; Windows'ta yok
+except ImportError:
+    fcntl = None
+
+
+def _read_mood_counts_file() -> Dict[str, int]:
+    """Sayaç dosyasını okur (yoksa/bozuksa boş sözlük)"""
+    try:
+        data = orjson.loads(MOOD_COUNTER_FILE.read_bytes().strip() or b"{}")
+        if isinstance(data, dict):
+            return {str(k): int(v) for k, v in data.items()}
+    except Exception:
+        pass
+    return {}
+
+
+def _merge_mood_counts_atomic(deltas: Dict[str, int]) -> None:
+    """Bu sürecin sayaç artışlarını dosyadaki değerlere ekleyip atomik yazar.
+
+    Kilit altında dosya yeniden okunur ve yalnızca son yazmadan beri biriken artışlar
+    eklenir; böylece birden çok worker süreci birbirinin sayımlarını ezmez. Yazma
+    süreç başına benzersiz geçici dosya + os.replace ile yapılır; okuyucular hiçbir
+    zaman yarım yazılmış JSON görmez. Kilit zaman aşımında TimeoutError fırlatılır.
+    """
+    with open(MOOD_COUNTER_LOCK_FILE, "w") as lock_file:
+        if fcntl is not None:
+            deadline = time.monotonic() + MOOD_COUNTER_LOCK_TIMEOUT
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError("sayaç kilidi alınamadı")
+                    time.sleep(0.05)
+        counts = _read_mood_counts_file()
+        for mood, delta in deltas.items():
+            counts[mood] = counts.get(mood, 0) + delta
+        fd, tmp = tempfile.mkstemp(dir=DATA_DIR, prefix="mood_counter.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(orjson.dumps(counts, option=orjson.OPT_INDENT_2))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, MOOD_COUNTER_FILE)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp)
+            raise
+
+
+def _messages_to_debug(ms: list[Dict[str, Any]]) -> str:
+    """Modele giden mesajları okunabilir tek bir metne çevirir (debug için)"""
+    parts: list[str] = []
+    for m in ms:
+        role = m.get("role", "")
+        if "content" in m and m["content"] is not None:
+            parts.append(f"{role}: {m['content']}")
+        elif "function_call" in m and m["function_call"] is not None:
+            parts.append(f"{role}: [function_call] {m['function_call']}")
+        else:
+            parts.append(f"{role}: ")
+    return "\n".join(parts)
+
+
+class PersistenceWriter:
+    """Sohbet geçmişi ve duygu sayaçlarını istek yolundan çıkarıp arka planda yazar.
+
+    Geçmiş satırları biriktirilir ve tek write() ile eklenir; sayaç artışları her turda
+    değil, en fazla PERSIST_FLUSH_INTERVAL saniyede bir dosyaya eklenir. Süreç kapanırken
+    bekleyen kayıtlar atexit ile yazılır.
+    """
+
+    def __init__(self, interval: float = PERSIST_FLUSH_INTERVAL) -> None:
+        self._interval = interval
+        self._lines: list[bytes] = []
+        self._count_deltas: Dict[str, int] = {}  # Son yazmadan beri biriken sayaç artışları
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        atexit.register(self.flush)
+
+    def append_history(self, line: bytes) -> None:
+        """Geçmiş satırını kuyruğa ekler (bloklamaz)"""
+        with self._cond:
+            self._lines.append(line)
+            self._wake()
+
+    def add_counts(self, deltas: Dict[str, int]) -> None:
+        """Sayaç artışlarını kaydedilmek üzere biriktirir (bloklamaz)"""
+        with self._cond:
+            for mood, delta in deltas.items():
+                self._count_deltas[mood] = self._count_deltas.get(mood, 0) + delta
+            self._wake()
+
+    def _wake(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="emotion-persist", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._lines and not self._count_deltas:
+                    self._cond.wait()
+            # Yakın zamanlı kayıtları tek yazmada birleştirmek için kısa bekle
+            time.sleep(self._interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Bekleyen geçmiş satırlarını ve sayaçları diske yazar"""
+        with self._cond:
+            lines, self._lines = self._lines, []
+            deltas, self._count_deltas = self._count_deltas, {}
+        if lines:
+            try:
+                with CHAT_HISTORY_FILE.open("ab") as f:
+                    f.write(b"".join(lines))
+            except Exception as e:
+                print(f"[EMOTION] Geçmiş yazma hatası: {e}")
+        if deltas:
+            try:
+                _merge_mood_counts_atomic(deltas)
+            except Exception as e:
+                print(f"[EMOTION] Sayaç yazma hatası: {e}")
+                # Artışlar kaybolmasın; bir sonraki yazmada tekrar denenir
+                self.add_counts(deltas)
+
+
+persistence_writer = PersistenceWriter()
+
 
 class EmotionChatbot:
-    def __init__(self, client: OpenAI = None) -> None:
+    def __init__(self, client: AsyncOpenAI = None) -> None:
         self.client = client
         self.use_gemini = False
+        self._gemini_model = None  # Gemini modeli bir kez oluşturulur, her mesajda değil
         if client is None:
-            self.use_gemini = True
-            # Gemini API'yi yapılandır - sadece API key ile
-            import google.generativeai as genai
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.messages: list[Dict[str, Any]] = []
+            self.switch_to_gemini()
+        # Son konuşma turları (konuşma geçmişi ana sistemdeki memory'de tutulur);
+        # sınırlı deque eski mesajları kendiliğinden atar, uzun oturumlarda bellek büyümez
+        self.messages: deque[Dict[str, Any]] = deque(maxlen=EMOTION_HISTORY_MAXLEN)
         self.stats: Dict[str, Any] = {
             "requests": 0,
             "last_request_at": None,
@@ -69,6 +318,12 @@ class EmotionChatbot:
             "Endişeli", "Yorgun", "Gururlu", "Çaresiz", "Flörtöz"
         ]
         self.emotion_counts: Dict[str, int] = {m: 0 for m in self.allowed_moods}
+        # Normalize mesaj -> (son geçerlilik, ham LLM yanıtı) (LRU)
+        self._completion_cache: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        # Fonksiyon listesi sabit; bir kez hesaplanır. Boş liste API'ye gönderilmez
+        # (OpenAI boş `functions` dizisini reddeder)
+        functions = self.get_functions()
+        self._function_kwargs: Dict[str, Any] = {"functions": functions, "function_call": "auto"} if functions else {}
         # Kalıcı sayaçları yükle
         persisted = self._load_mood_counts()
         if persisted:
@@ -77,6 +332,15 @@ class EmotionChatbot:
                 if k in self.emotion_counts and isinstance(v, int):
                     self.emotion_counts[k] = v
 
+    def switch_to_gemini(self) -> None:
+        """OpenAI kullanılamadığında Gemini'ye geçer (konuşma geçmişi korunur)"""
+        # Gemini API'yi yapılandır - sadece API key ile
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self._gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+        self.client = None
+        self.use_gemini = True
+
     def _sanitize_emotion_input(self, text: str) -> str:
         """Duygu sistemi için güvenli input sanitization"""
         if not text:
@@ -85,16 +349,15 @@ class EmotionChatbot:
         # HTML escape
         text = html.escape(text, quote=True)
         
-        # Tehlikeli pattern'leri kontrol et
-        for pattern in DANGEROUS_EMOTION_PATTERNS:
-            if re.search(pattern, text, re.IGNORECASE):
-                print(f"[SECURITY] Duygu sisteminde tehlikeli pattern: {pattern}")
-                return "[Güvenlik nedeniyle mesaj filtrelendi]"
+        # Tehlikeli pattern'leri tek taramada kontrol et
+        match = _DANGEROUS_EMOTION_RE.search(text)
+        if match:
+            pattern = DANGEROUS_EMOTION_PATTERNS[match.lastindex - 1]
+            print(f"[SECURITY] Duygu sisteminde tehlikeli pattern: {pattern}")
+            return "[Güvenlik nedeniyle mesaj filtrelendi]"
         
         # Fazla boşlukları temizle
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        return text
+        return collapse_whitespace(text)
 
     def _validate_emotion_message_length(self, text: str) -> bool:
         """Duygu mesajı uzunluk kontrolü"""
@@ -120,35 +383,22 @@ class EmotionChatbot:
 
     def _load_mood_counts(self) -> Dict[str, int]:
         """Kalıcı duygu sayaçlarını yükler"""
-        try:
-            raw = MOOD_COUNTER_FILE.read_text(encoding="utf-8").strip() or "{}"
-            data = json.loads(raw)
-            if isinstance(data, dict):
-                return {str(k): int(v) for k, v in data.items()}
-        except Exception:
-            pass
-        return {}
+        return _read_mood_counts_file()
 
-    def _save_mood_counts(self) -> None:
-        """Duygu sayaçlarını kalıcı olarak kaydeder"""
-        try:
-            MOOD_COUNTER_FILE.write_text(
-                json.dumps(self.emotion_counts, ensure_ascii=False, indent=2),
-                encoding="utf-8",
-            )
-        except Exception:
-            pass
+    def _save_mood_counts(self, deltas: Dict[str, int]) -> None:
+        """Duygu sayacı artışlarını kalıcı olarak kaydeder (arka planda, dosyadakine eklenerek)"""
+        if deltas:
+            persistence_writer.add_counts(deltas)
 
     def _append_chat_history(self, user_message: str, response_text: str) -> None:
-        """Konuşma geçmişini dosyaya ekler"""
+        """Konuşma geçmişini dosyaya ekler (arka planda, toplu yazma ile)"""
         try:
-            line = json.dumps({
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            line = orjson.dumps({
+                "timestamp": _timestamp(),
                 "user": user_message,
                 "response": response_text
-            }, ensure_ascii=False)
-            with CHAT_HISTORY_FILE.open("a", encoding="utf-8") as f:
-                f.write(line + "\n")
+            })  # orjson UTF-8 bayt üretir; dosyaya doğrudan yazılır
+            persistence_writer.append_history(line + b"\n")
         except Exception:
             pass
 
@@ -158,8 +408,80 @@ class EmotionChatbot:
 
     # İstatistik fonksiyonları bu sistemden kaldırıldı; StatisticSystem kullanılacak.
 
-    def chat(self, user_message: str) -> Dict[str, Any]:
-        """Ana sohbet fonksiyonu - duygu analizi ve yanıt üretir"""
+    async def _complete(
+        self, messages_payload: list[Dict[str, Any]], on_token: Callable[[str], None] | None = None
+    ) -> str:
+        """Mesajları seçili LLM'e gönderir ve ham metin yanıtını döndürür.
+
+        `on_token` verilirse yanıt stream edilir ve her parça bu callback'e iletilir.
+        """
+        if self.use_gemini:
+            # Gemini API kullan - model switch_to_gemini'de oluşturuldu
+            # Gemini için mesajları düz metne çevir
+            prompt_text = self._convert_messages_to_prompt(messages_payload)
+            if on_token is None:
+                response = await self._gemini_model.generate_content_async(prompt_text)
+                return response.text or ""
+            parts: list[str] = []
+            async for chunk in await self._gemini_model.generate_content_async(prompt_text, stream=True):
+                piece = chunk.text or ""
+                if piece:
+                    parts.append(piece)
+                    on_token(piece)
+            return "".join(parts)
+        # OpenAI API kullan
+        # Emotion sistemi function-calling kullanmaz; istatistikler ayrı sistemdedir.
+        # Modelden JSON veya düz metin bekliyoruz
+        if on_token is None:
+            completion = await self.client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages_payload,
+                **self._function_kwargs,
+                temperature=0.2,
+            )
+            return completion.choices[0].message.content or ""
+        parts = []
+        stream = await self.client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages_payload,
+            **self._function_kwargs,
+            temperature=0.2,
+            stream=True,
+        )
+        async for chunk in stream:
+            piece = chunk.choices[0].delta.content if chunk.choices else None
+            if piece:
+                parts.append(piece)
+                on_token(piece)
+        return "".join(parts)
+
+    def _completion_cache_get(self, key: str) -> str | None:
+        """Süresi geçmemiş önbellekli LLM yanıtını döndürür"""
+        entry = self._completion_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._completion_cache[key]
+            return None
+        self._completion_cache.move_to_end(key)
+        return entry[1]
+
+    def _completion_cache_put(self, key: str, content: str) -> None:
+        """LLM yanıtını saklar; kapasite aşılırsa en eskiyi siler"""
+        self._completion_cache[key] = (time.monotonic() + EMOTION_CACHE_TTL, content)
+        self._completion_cache.move_to_end(key)
+        if len(self._completion_cache) > EMOTION_CACHE_MAXSIZE:
+            self._completion_cache.popitem(last=False)
+
+    async def chat(
+        self, user_message: str, on_token: Callable[[str], None] | None = None, debug: bool = False
+    ) -> Dict[str, Any]:
+        """Ana sohbet fonksiyonu - duygu analizi ve yanıt üretir (LLM çağrısı beklenirken event loop serbest).
+
+        `on_token` verilirse ham model çıktısı üretilirken parça parça iletilir; JSON
+        ayrıştırma, sayaçlar ve emoji seçimi stream tamamlandıktan sonra yapılır.
+        `debug` True ise modele giden tam metin `request_debug` alanında döner.
+        """
         # Güvenlik kontrolleri
         if not user_message:
             return {"response": "Mesaj boş olamaz"}
@@ -174,123 +496,58 @@ class EmotionChatbot:
             return {"response": "Güvenlik nedeniyle mesaj filtrelendi"}
         
         self.stats["requests"] += 1
-        self.stats["last_request_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.stats["last_request_at"] = _timestamp()
 
         # ConversationSummaryBufferMemory sistemi kullanılacak - bu kısım kaldırıldı
         # Sadece sistem promptu ve kullanıcı mesajı - memory chain tarafından yönetilecek
         # Önceki konuşma geçmişi ana sistem tarafından ConversationSummaryBufferMemory ile yönetiliyor
-        messages_payload: list[Dict[str, Any]] = [{"role": "system", "content": self._get_emotion_system_prompt().strip()}]
-        messages_payload.append({"role": "user", "content": user_message})
-
-        # Debug için OpenAI'ye giden tam metni hazırla
-        def _messages_to_debug(ms: list[Dict[str, Any]]) -> str:
-            parts: list[str] = []
-            for m in ms:
-                role = m.get("role", "")
-                if "content" in m and m["content"] is not None:
-                    parts.append(f"{role}: {m['content']}")
-                elif "function_call" in m and m["function_call"] is not None:
-                    parts.append(f"{role}: [function_call] {m['function_call']}")
-                else:
-                    parts.append(f"{role}: ")
-            return "\n".join(parts)
-
-        request_debug = _messages_to_debug(messages_payload)
-
-        if self.use_gemini:
-            # Gemini API kullan - sadece API key ile
-            import google.generativeai as genai
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            # Gemini için mesajları düz metne çevir
-            prompt_text = self._convert_messages_to_prompt(messages_payload)
-            response = model.generate_content(prompt_text)
-            # Gemini response'unu OpenAI formatına çevir
-            completion = type('obj', (object,), {
-                'choices': [type('obj', (object,), {
-                    'message': type('obj', (object,), {
-                        'content': response.text,
-                        'function_call': None
-                    })()
-                })()]
-            })()
+        messages_payload: list[Dict[str, Any]] = [_EMOTION_SYSTEM_MESSAGE, {"role": "user", "content": user_message}]
+
+        # Debug için OpenAI'ye giden tam metin yalnızca istenirse hazırlanır
+        request_debug = _messages_to_debug(messages_payload) if debug else None
+
+        # Aynı (normalize) mesaj için LLM tekrar çağrılmaz; sayaçlar ve emoji seçimi
+        # önbellekten dönen yanıt için de aşağıda normal şekilde güncellenir
+        cache_key = normalize_cache_text(user_message)
+        content = self._completion_cache_get(cache_key)
+        from_cache = content is not None
+        if from_cache:
+            print("[EMOTION] Yanıt önbellekten döndü (LLM atlandı)")
+            if on_token is not None:
+                on_token(content)
         else:
-            # OpenAI API kullan
-            completion = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages_payload,
-                functions=self.get_functions(),
-                function_call="auto",
-                temperature=0.2,
-            )
-
-        msg = completion.choices[0].message
-
-        # Emotion sistemi function-calling kullanmaz; istatistikler ayrı sistemdedir.
-
-        # Aksi halde modelden JSON veya fonksiyon benzeri metin bekliyoruz
-        content = msg.content or ""
+            content = await self._complete(messages_payload, on_token)
 
         # İstatistik düz metin yakalama kaldırıldı; STATS akışına devredildi.
 
-        def extract_json_object(text: str) -> Dict[str, Any] | None:
-            # code fence temizle
-            t = text.replace("```json", "").replace("```", "").strip()
-            # İlk dengeli JSON objesini çıkar (kaçışlı stringleri hesaba kat)
-            start = t.find('{')
-            if start == -1:
-                return None
-            depth = 0
-            in_string = False
-            escape = False
-            end_index = -1
-            for i in range(start, len(t)):
-                ch = t[i]
-                if in_string:
-                    if escape:
-                        escape = False
-                    elif ch == '\\':
-                        escape = True
-                    elif ch == '"':
-                        in_string = False
-                else:
-                    if ch == '"':
-                        in_string = True
-                    elif ch == '{':
-                        depth += 1
-                    elif ch == '}':
-                        depth -= 1
-                        if depth == 0:
-                            end_index = i
-                            break
-            if end_index == -1:
-                return None
-            candidate = t[start:end_index + 1]
-            try:
-                return json.loads(candidate)
-            except Exception:
-                return None
-
-        data = extract_json_object(content)
+        data = _extract_json_object(content)
+        if data and not from_cache:
+            # Yalnızca geçerli JSON yanıtlar önbelleğe alınır
+            self._completion_cache_put(cache_key, content)
         if not data:
             # Ham chat'i kaydet
             self._append_chat_history(user_message, content)
             # Geçmişe ekle
             self.messages.append({"role": "user", "content": user_message})
             self.messages.append({"role": "assistant", "content": content})
-            return {"response": content, "request_debug": request_debug}
+            result: Dict[str, Any] = {"response": content}
+            if request_debug is not None:
+                result["request_debug"] = request_debug
+            return result
 
-        required_keys = {"kullanici_ruh_hali", "ilk_ruh_hali", "ilk_cevap", "ikinci_ruh_hali", "ikinci_cevap"}
-        missing = [k for k in required_keys if k not in data]
-        if missing:
+        if not EMOTION_REQUIRED_KEYS.issubset(data):
             # Ham chat'i kaydet
             self._append_chat_history(user_message, content)
             return {"response": content}
 
-        # Duygu sayaçlarını güncelle
+        # Duygu sayaçlarını güncelle (artışlar ayrıca kalıcı kayıt için toplanır)
+        deltas: Dict[str, int] = {}
+
         def inc(mood: str) -> None:
             key = (mood or "").strip()
             if key in self.emotion_counts:
                 self.emotion_counts[key] += 1
+                deltas[key] = deltas.get(key, 0) + 1
 
         user_mood_raw = str(data.get("kullanici_ruh_hali", ""))
         first_mood_raw = str(data.get("ilk_ruh_hali", ""))
@@ -300,75 +557,28 @@ class EmotionChatbot:
         inc(first_mood_raw)
         inc(second_mood_raw)
         # Sayaçları kalıcı kaydet
-        self._save_mood_counts()
+        self._save_mood_counts(deltas)
 
         # Emoji seçim: mood_emojis.json'dan duyguya göre rastgele
-        def normalize_mood(name: str) -> str:
-            n = name.strip().lower()
-            mapping = {
-                "utangaç": "Utanmış",
-                "utanmış": "Utanmış",
-                "gülümseyen": "Gülümseyen",
-                "mutlu": "Mutlu",
-                "üzgün": "Üzgün",
-                "öfkeli": "Öfkeli",
-                "şaşkın": "Şaşkın",
-                "endişeli": "Endişeli",
-                "flörtöz": "Flörtöz",
-                "sorgulayıcı": "Sorgulayıcı",
-                "yorgun": "Yorgun",
-            }
-            return mapping.get(n, name)
-
-        def pick_emoji(mood: str) -> Optional[str]:
-            key = normalize_mood(mood)
-            options = MOOD_EMOJIS.get(key)
-            if options:
-                try:
-                    return random.choice(options)
-                except Exception:
-                    return None
-            return None
-
-        first_emoji = pick_emoji(first_mood_raw)
-        second_emoji = pick_emoji(second_mood_raw)
+        first_emoji = _pick_emoji(first_mood_raw)
+        second_emoji = _pick_emoji(second_mood_raw)
 
-        response_text = json.dumps(data, ensure_ascii=False)
+        response_text = orjson.dumps(data).decode()
         # Ham chat'i kaydet
         self._append_chat_history(user_message, response_text)
         # Geçmişe ekle
         self.messages.append({"role": "user", "content": user_message})
         self.messages.append({"role": "assistant", "content": response_text})
 
-        return {
+        result = {
             "response": response_text,
             "first_emoji": first_emoji,
             "second_emoji": second_emoji,
-            "request_debug": request_debug,
         }
+        if request_debug is not None:
+            result["request_debug"] = request_debug
+        return result
 
     def _get_emotion_system_prompt(self) -> str:
         """Duygu analizi için sistem prompt'unu döndürür"""
-        return """
-Sen bir duygu sınıflandırma ve yanıt üretme modelisin.
-Görevin şunlardır:
-
-1. Kullanıcının mesajındaki duyguyu tahmin et.
-2. O duyguya uygun bir ilk cevap yaz.
-3. Ardından ilk duygu ile uyumlu bir ikinci duygu seç; gerekirse aynı duyguyu tekrar seçebilirsin.
-4. Seçilen ikinci duyguya uygun bir ikinci cevap yaz (ilk yanıtla tutarlı olmalıdır).
-5. Çıktıyı Türkçe ver ve her iki yanıt da sadece 1 cümle olmalıdır.
-6. Ek olarak, kullanıcının verdiği mesajdan kullanıcının duygu durumunu tek bir etiket ile belirle.
-6. Çıktıyı her zaman aşağıdaki JSON formatında ver:
-
-{
-  "kullanici_ruh_hali": "...",
-  "ilk_ruh_hali": "...",
-  "ilk_cevap": "...",
-  "ikinci_ruh_hali": "...",
-  "ikinci_cevap": "..."
-}
-
-Seçilebilecek ruh halleri:
-Mutlu, Üzgün, Öfkeli, Şaşkın, Utanmış, Endişeli, Gülümseyen, Flörtöz, Sorgulayıcı, Sorgulayıcı, Yorgun
-"""
+        return EMOTION_SYSTEM_PROMPT
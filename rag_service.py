@@ -11,8 +11,11 @@ import os
 import re
 import html
 from pathlib import Path
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 
+from security import collapse_whitespace
+
 import os
 # chromadb import edilmeden ÖNCE telemetriyi kapat
 os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
@@ -70,11 +73,25 @@ DANGEROUS_RAG_PATTERNS = [
     r'<object[^>]*>',
     r'<embed[^>]*>',
 ]
+# Pattern'ler tek bir alternation olarak bir kez derlenir; eşleşen pattern lastindex ile bulunur
+_DANGEROUS_RAG_RE = re.compile(
+    "|".join(f"({p})" for p in DANGEROUS_RAG_PATTERNS), re.IGNORECASE | re.DOTALL
+)
 
 ROOT_DIR = Path(__file__).parent
 PDFS_DIR = ROOT_DIR / "PDFs"
 CHROMA_DIR = ROOT_DIR / ".chroma"
 COLLECTION_NAME = "project_pdfs"
+EMBED_CACHE_MAXSIZE = 1024  # Sorgu embedding önbelleği kapasitesi
+
+
+def _embedding_device() -> str:
+    """Embedding modeli için cihazı döndürür: CUDA varsa "cuda", değilse "cpu" """
+    try:
+        import torch  # Yerinde import: bağımlılık yoksa hata kontrollü yakalanır
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
 
 
 class RagService:
@@ -87,6 +104,10 @@ class RagService:
         self._embedder = None
         self._model_loading = False
         self._model_loaded = False
+        # İndeks dolu olduğu bir kez doğrulandıktan sonra her sorguda count() yapılmaz
+        self._index_ready = False
+        # Aynı sorgunun embedding'i tekrar hesaplanmaz (spekülatif + asıl retrieval, tekrar eden sorular)
+        self._embed_query = lru_cache(maxsize=EMBED_CACHE_MAXSIZE)(self._embed_query_uncached)
 
     def _sanitize_rag_query(self, query: str) -> str:
         """RAG sorgusu için güvenli input sanitization"""
@@ -96,16 +117,15 @@ class RagService:
         # HTML escape
         query = html.escape(query, quote=True)
         
-        # Tehlikeli pattern'leri kontrol et
-        for pattern in DANGEROUS_RAG_PATTERNS:
-            if re.search(pattern, query, re.IGNORECASE):
-                print(f"[SECURITY] RAG sisteminde tehlikeli pattern: {pattern}")
-                return "[Güvenlik nedeniyle sorgu filtrelendi]"
+        # Tehlikeli pattern'leri tek taramada kontrol et
+        match = _DANGEROUS_RAG_RE.search(query)
+        if match:
+            pattern = DANGEROUS_RAG_PATTERNS[match.lastindex - 1]
+            print(f"[SECURITY] RAG sisteminde tehlikeli pattern: {pattern}")
+            return "[Güvenlik nedeniyle sorgu filtrelendi]"
         
         # Fazla boşlukları temizle
-        query = re.sub(r'\s+', ' ', query).strip()
-        
-        return query
+        return collapse_whitespace(query)
 
     def _validate_rag_query_length(self, query: str) -> bool:
         """RAG sorgu uzunluk kontrolü"""
@@ -130,14 +150,32 @@ class RagService:
         self._client = chromadb.PersistentClient(path=str(CHROMA_DIR))
 
     def _init_embedder(self) -> None:
-        """Embedding modelini yükler"""
+        """Embedding modelini yükler (GPU varsa CUDA üzerinde FP16)"""
         # All-MiniLM-L6-v2: hafif ve yaygın
-        print("[RAG] Embedding modeli yükleniyor: all-MiniLM-L6-v2")
+        device = _embedding_device()
+        print(f"[RAG] Embedding modeli yükleniyor: all-MiniLM-L6-v2 (device={device})")
         self._embedder = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
+            model_name="all-MiniLM-L6-v2",
+            device=device,
         )
+        if device == "cuda":
+            # FP16: bellek bant genişliği yarıya iner; cosine sıralaması pratikte değişmez
+            try:
+                model = getattr(self._embedder, "_model", None)
+                if model is not None:
+                    model.half()
+            except Exception as e:
+                print(f"[RAG] FP16'ya geçilemedi, FP32 ile devam: {e}")
         self._model_loaded = True
 
+    def load_model(self) -> None:
+        """Embedding modelini ve indeksi senkron olarak hazırlar (startup'ta thread'de çağrılır)"""
+        if self._embedder is None and not self._model_loading:
+            self._init_embedder()
+        self.ensure_index()
+        # İlk sorguda model ısınma maliyeti ödenmesin diye bir kez embed et
+        self._embed_query("ısınma")
+
     def preload_model_async(self) -> None:
         """Asenkron olarak modeli önceden yükle (site başlatıldığında)"""
         if self._model_loading or self._model_loaded:
@@ -160,7 +198,9 @@ class RagService:
         thread.start()
 
     def _get_collection(self):
-        """ChromaDB koleksiyonunu alır veya oluşturur"""
+        """ChromaDB koleksiyonunu alır veya oluşturur (ilk çağrıdan sonra önbellekten)"""
+        if self._collection is not None:
+            return self._collection
         if self._client is None:
             self._init_client()
         if self._embedder is None:
@@ -191,6 +231,7 @@ class RagService:
             col._embedding_function = self._embedder
         except Exception:
             pass
+        self._collection = col
         return col
 
     def _read_pdf_text(self, path: Path) -> str:
@@ -234,6 +275,8 @@ class RagService:
 
     def ensure_index(self) -> Dict[str, Any]:
         """Koleksiyon boşsa PDF'leri indeksle (tekrarlanabilir)"""
+        if self._index_ready:
+            return {"status": "ok", "message": "mevcut indeks"}
         col = self._get_collection()
         count = 0
         try:
@@ -242,6 +285,7 @@ class RagService:
             count = 0
         if count > 0:
             print(f"[RAG] Mevcut indeks bulundu. Toplam vektör: {count}")
+            self._index_ready = True
             return {"status": "ok", "indexed": count, "message": "mevcut indeks"}
 
         PDFS_DIR.mkdir(parents=True, exist_ok=True)
@@ -286,34 +330,59 @@ class RagService:
                         except Exception as e2:
                             print(f"[RAG] Mini batch de başarısız: {e2}")
             print(f"[RAG] Toplam {total_added} belge koleksiyona eklendi.")
+            self._index_ready = total_added > 0
         else:
             print("[RAG] Eklenecek belge bulunamadı (boş metin).")
         return {"status": "ok", "indexed": len(docs), "files": [p.name for p in pdf_files]}
 
-    def retrieve_top(self, query: str, top_k: int = 4) -> List[Dict[str, Any]]:
-        """Genel arama yapar"""
+    def _prepare_query(self, query: str) -> str:
+        """Sorguyu doğrular ve temizler; geçersizse boş string döndürür"""
         # Güvenlik kontrolleri
         if not query:
-            return []
+            return ""
         
         # Sorgu uzunluk kontrolü
         if not self._validate_rag_query_length(query):
             print(f"[SECURITY] RAG sorgusu çok uzun: {len(query)}")
-            return []
+            return ""
         
         # Input sanitization
         query = self._sanitize_rag_query(query)
         if query == "[Güvenlik nedeniyle sorgu filtrelendi]":
             print("[SECURITY] RAG sorgusu güvenlik nedeniyle filtrelendi")
-            return []
-        
-        print(f"[RAG] Genel arama: top_k={top_k}, sorgu='{query[:100]}'")
-        col = self._get_collection()
+            return ""
+        return query
+
+    def _embed_query_uncached(self, query: str) -> List[float]:
+        """Temizlenmiş sorgunun embedding vektörünü hesaplar"""
+        if self._embedder is None:
+            self._get_collection()
+        vector = self._embedder([query])[0]
+        # Chroma düz Python float listesi bekler (numpy dizisi değil)
+        return vector.tolist() if hasattr(vector, "tolist") else [float(x) for x in vector]
+
+    def _query_vector(self, query: str) -> Optional[List[float]]:
+        """Sorguyu temizleyip embed eder; sorgu geçersizse None döner.
+
+        Aynı sorgunun vektörü _embed_query önbelleğinden döner (spekülatif genel
+        retrieval ardından asıl retrieval gelirse model ikinci kez çalışmaz).
+        """
+        query = self._prepare_query(query)
+        if not query:
+            return None
+        return self._embed_query(query)
+
+    def _query(self, vector: List[float], top_k: int, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Hazır vektörle Chroma'da arama yapar ve sonuçları düz listeye çevirir"""
         self.ensure_index()
+        col = self._get_collection()
+        kwargs: Dict[str, Any] = {"query_embeddings": [vector], "n_results": max(1, top_k)}
+        if where:
+            kwargs["where"] = where
         try:
-            res = col.query(query_texts=[query], n_results=max(1, top_k))
+            res = col.query(**kwargs)
         except Exception:
-            print("[RAG] Genel aramada Chroma sorgu hatası.")
+            print("[RAG] Chroma sorgu hatası.")
             return []
         out: List[Dict[str, Any]] = []
         ids = (res.get("ids") or [[]])[0]
@@ -327,50 +396,25 @@ class RagService:
                 "metadata": metas[i] if i < len(metas) else {},
                 "score": dists[i] if i < len(dists) else None,
             })
+        return out
+
+    def retrieve_top(self, query: str, top_k: int = 4) -> List[Dict[str, Any]]:
+        """Genel arama yapar"""
+        vector = self._query_vector(query)
+        if vector is None:
+            return []
+        print(f"[RAG] Genel arama: top_k={top_k}, sorgu='{query[:100]}'")
+        out = self._query(vector, top_k)
         print(f"[RAG] Genel arama tamam: {len(out)} sonuç")
         return out
 
     def retrieve_by_source(self, query: str, source_filename: str, top_k: int = 4) -> List[Dict[str, Any]]:
         """Belirli kaynağa göre arama yapar"""
-        # Güvenlik kontrolleri
-        if not query:
-            return []
-        
-        # Sorgu uzunluk kontrolü
-        if not self._validate_rag_query_length(query):
-            print(f"[SECURITY] RAG sorgusu çok uzun: {len(query)}")
+        vector = self._query_vector(query)
+        if vector is None:
             return []
-        
-        # Input sanitization
-        query = self._sanitize_rag_query(query)
-        if query == "[Güvenlik nedeniyle sorgu filtrelendi]":
-            print("[SECURITY] RAG sorgusu güvenlik nedeniyle filtrelendi")
-            return []
-        
         print(f"[RAG] Kaynak bazlı arama: source='{source_filename}', top_k={top_k}")
-        col = self._get_collection()
-        self.ensure_index()
-        try:
-            res = col.query(
-                query_texts=[query],
-                n_results=max(1, top_k),
-                where={"source": source_filename},
-            )
-        except Exception:
-            print("[RAG] Kaynak bazlı aramada Chroma sorgu hatası.")
-            return []
-        out: List[Dict[str, Any]] = []
-        ids = (res.get("ids") or [[]])[0]
-        docs = (res.get("documents") or [[]])[0]
-        metas = (res.get("metadatas") or [[]])[0]
-        dists = (res.get("distances") or [[]])[0]
-        for i in range(min(len(ids), len(docs))):
-            out.append({
-                "id": ids[i],
-                "text": docs[i],
-                "metadata": metas[i] if i < len(metas) else {},
-                "score": dists[i] if i < len(dists) else None,
-            })
+        out = self._query(vector, top_k, where={"source": source_filename})
         print(f"[RAG] Kaynak bazlı arama tamam: {len(out)} sonuç")
         return out
 
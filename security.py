@@ -0,0 +1,114 @@
+"""
+SECURITY - Ortak Girdi Temizleme
+================================
+
+Chat endpoint'i ve hayvan sistemi aynı sanitization kurallarını kullanır.
+- Tehlikeli pattern'ler modül yüklenirken bir kez derlenir (Hyperscan varsa DFA, yoksa tek regex)
+- HTML escape yalnızca gerektiğinde yapılır; boşluk temizliği regex kullanmaz
+"""
+
+import html
+import re
+import unicodedata
+
+# Güvenlik sabitleri
+MAX_MESSAGE_LENGTH = 2000  # Maksimum mesaj uzunluğu
+FILTERED_MESSAGE = "[Güvenlik nedeniyle mesaj filtrelendi]"
+DANGEROUS_PATTERNS = [
+    r'<script[^>]*>.*?</script>',  # Script injection
+    r'javascript:',  # JavaScript URL
+    r'data:text/html',  # Data URL
+    r'vbscript:',  # VBScript
+    r'on\w+\s*=',  # Event handlers
+    r'<iframe[^>]*>',  # Iframe injection
+    r'<object[^>]*>',  # Object injection
+    r'<embed[^>]*>',  # Embed injection
+    r'<link[^>]*>',  # Link injection
+    r'<meta[^>]*>',  # Meta injection
+]
+# Tüm pattern'ler tek bir alternation olarak derlenir; DOTALL ile çok satırlı
+# <script> blokları da yakalanır
+# (her pattern kendi grubunda; eşleşen pattern lastindex ile bulunur)
+_DANGEROUS_RE = re.compile("|".join(f"({p})" for p in DANGEROUS_PATTERNS), re.IGNORECASE | re.DOTALL)
+
+
+def _compile_hyperscan():
+    """Hyperscan kuruluysa pattern'leri tek bir DFA veritabanında derler (yoksa None).
+
+    Hyperscan tüm pattern'leri girdi üzerinde tek geçişte tarar; geri izleme (backtracking)
+    yapmadığından kapanmayan çok sayıda <script> gibi kötü niyetli girdilerde de doğrusal kalır.
+    """
+    try:
+        import hyperscan  # type: ignore
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[p.encode() for p in DANGEROUS_PATTERNS],
+            ids=list(range(len(DANGEROUS_PATTERNS))),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_DOTALL | hyperscan.HS_FLAG_SINGLEMATCH]
+            * len(DANGEROUS_PATTERNS),
+        )
+        return db
+    except Exception:
+        # Kurulu değilse veya derlenemezse birleşik regex kullanılır
+        return None
+
+
+_HS_DB = _compile_hyperscan()
+
+
+def _find_dangerous_pattern(text: str) -> str | None:
+    """Eşleşen ilk tehlikeli pattern'i döndürür (Hyperscan varsa onunla, yoksa regex ile)"""
+    if _HS_DB is not None:
+        matched: list[int] = []
+
+        def on_match(pattern_id, start, end, flags, context):
+            # SINGLEMATCH: her pattern en fazla bir kez bildirilir; tarama sürdürülür
+            # (durdurmak ScanTerminated fırlatır)
+            matched.append(pattern_id)
+
+        _HS_DB.scan(text.encode("utf-8"), match_event_handler=on_match)
+        return DANGEROUS_PATTERNS[matched[0]] if matched else None
+    match = _DANGEROUS_RE.search(text)
+    return DANGEROUS_PATTERNS[match.lastindex - 1] if match else None
+
+# Hızlı yol: HTML escape sadece gerektiğinde yapılır
+_ESC_CHARS = frozenset('<>&"\'')
+
+
+def collapse_whitespace(text: str) -> str:
+    """Ardışık boşlukları tek boşluğa indirir ve baş/son boşlukları atar.
+
+    str.split() argümansız çağrıda regex'teki \\s ile aynı karakterlerde böler;
+    regex motoruna girmeden C döngüsünde çalışır.
+    """
+    return " ".join(text.split())
+
+
+def normalize_cache_text(text: str) -> str:
+    """Önbellek anahtarları için ortak normalizasyon: NFKC, küçük harf, sade boşluk.
+
+    /chat yanıt önbelleği ve duygu yanıtı önbelleği aynı fonksiyonu kullanır.
+    """
+    return collapse_whitespace(unicodedata.normalize("NFKC", text).lower())
+
+
+def sanitize(text: str, source: str = "CHAT") -> str:
+    """Güvenli input sanitization - injection saldırılarını önler.
+
+    Tehlikeli pattern bulunursa FILTERED_MESSAGE döner; `source` yalnızca log içindir.
+    """
+    if not text:
+        return ""
+
+    # HTML escape (özel karakter yoksa yeni string üretmeye gerek yok)
+    if not _ESC_CHARS.isdisjoint(text):
+        text = html.escape(text, quote=True)
+
+    # Tehlikeli pattern'leri tek taramada kontrol et
+    pattern = _find_dangerous_pattern(text)
+    if pattern:
+        print(f"[SECURITY] {source}: tehlikeli pattern tespit edildi: {pattern}")
+        return FILTERED_MESSAGE
+
+    # Fazla boşlukları temizle
+    return collapse_whitespace(text)
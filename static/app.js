@@ -166,6 +166,64 @@
             }
         }
 
+        const FLOW_MESSAGES = {
+            "RAG": "RAG çağırılıyor...",
+            "ANIMAL": "Hayvan API sistemi çağırılıyor...",
+            "EMOTION": "Duygu analizi yapılıyor...",
+            "STATS": "İstatistikler hesaplanıyor...",
+            "HELP": "Yardım hazırlanıyor..."
+        };
+
+        // Yarım gelen JSON metninden bir string alanın o ana kadarki değerini çıkarır
+        function partialJsonString(text, key) {
+            const m = text.match(new RegExp('"' + key + '"\\s*:\\s*"((?:[^"\\\\]|\\\\.)*)'));
+            if (!m) return null;
+            try {
+                return JSON.parse('"' + m[1].replace(/\\$/, '') + '"');
+            } catch (_) {
+                return m[1];
+            }
+        }
+
+        // /chat/stream SSE yanıtını okur; ara olayları onEvent'e iletir, nihai sonucu döndürür
+        // (EventSource sadece GET desteklediği için fetch + ReadableStream kullanılır)
+        async function readChatStream(message, onEvent) {
+            const resp = await fetch('/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: JSON.stringify({ message })
+            });
+            if (!resp.ok || !resp.body) {
+                // Hata yanıtları (ör. 429 hız sınırı) JSON detail taşır
+                const err = await resp.json().catch(() => null);
+                if (err && err.detail) return { error: err.detail };
+                throw new Error('HTTP ' + resp.status);
+            }
+            const reader = resp.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let sep;
+                while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, sep);
+                    buffer = buffer.slice(sep + 2);
+                    let event = 'message';
+                    let payload = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) payload += line.slice(6);
+                    }
+                    const parsed = JSON.parse(payload || '{}');
+                    if (event === 'result') return parsed;
+                    onEvent(event, parsed);
+                }
+            }
+            throw new Error('Yanıt akışı tamamlanmadan kesildi');
+        }
+
         async function sendMessage() {
             const input = document.getElementById('user-input');
             const message = input.value.trim();
@@ -178,24 +236,28 @@
             disableInput(true);
 
             try {
-                const resp = await fetch('/chat', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ message })
+                // SSE: akış kararı ve RAG parçaları geldikçe loading mesajında gösterilir
+                let streamed = '';
+                let streamFlow = null;
+                const data = await readChatStream(message, (event, payload) => {
+                    if (event === 'flow') {
+                        streamFlow = payload.flow_type;
+                        updateLoadingMessage(FLOW_MESSAGES[payload.flow_type] || 'İşleniyor...');
+                    } else if (event === 'token') {
+                        streamed += payload.token;
+                        if (streamFlow === 'EMOTION') {
+                            // Duygu yanıtı JSON gelir; ilk cevabı oluştukça göster
+                            const partial = partialJsonString(streamed, 'ilk_cevap');
+                            if (partial) updateLoadingMessage(partial);
+                        } else {
+                            updateLoadingMessage(streamed);
+                        }
+                    }
                 });
-                const data = await resp.json();
                 
                 // Response içindeki flow_type'a göre loading mesajını güncelle veya kaldır
-                if (data.flow_type) {
-                    const flowMessages = {
-                        "RAG": "RAG çağırılıyor...",
-                        "ANIMAL": "Hayvan API sistemi çağırılıyor...",
-                        "EMOTION": "Duygu analizi yapılıyor...",
-                        "STATS": "İstatistikler hesaplanıyor...",
-                        "HELP": "Yardım hazırlanıyor..."
-                    };
-                    const flowMessage = flowMessages[data.flow_type] || 'İşleniyor...';
-                    updateLoadingMessage(flowMessage);
+                if (data.flow_type && !streamed) {
+                    updateLoadingMessage(FLOW_MESSAGES[data.flow_type] || 'İşleniyor...');
                     // Kısa bir süre güncellenmiş mesajı göster, sonra kaldır
                     setTimeout(() => removeLoadingMessage(), 300);
                 } else {
@@ -14,10 +14,11 @@ Güvenlik/sağlamlık notları:
 from __future__ import annotations
 
 import os
-import json
 import re
+import orjson
+import threading
+import time
 from typing import Any, Dict, Optional, Tuple
-from datetime import datetime
 from pathlib import Path
 
 
@@ -36,6 +37,11 @@ class StatisticSystem:
             "Mutlu", "Üzgün", "Öfkeli", "Şaşkın", "Utangaç",
             "Endişeli", "Yorgun", "Gururlu", "Çaresiz", "Flörtöz"
         ]
+        # Bugünün sayaçları artımlı tutulur (bkz. _read_today_counts_from_chat_history)
+        self._history_lock = threading.Lock()
+        self._history_offset = 0
+        self._today = ""
+        self._today_counts: Dict[str, int] = {m: 0 for m in self.allowed_moods}
 
     # -------------------------- Yardımcılar -------------------------- #
     def _normalize_emotion(self, name: str | None) -> Optional[str]:
@@ -85,8 +91,8 @@ class StatisticSystem:
         """mood_counter.txt içindeki tüm zamanlar sayacını oku (yoksa boş)."""
         try:
             if MOOD_COUNTER_FILE.exists():
-                raw = MOOD_COUNTER_FILE.read_text(encoding="utf-8").strip() or "{}"
-                data = json.loads(raw)
+                raw = MOOD_COUNTER_FILE.read_bytes().strip() or b"{}"
+                data = orjson.loads(raw)
                 if isinstance(data, dict):
                     return {str(k): int(v) for k, v in data.items()}
         except Exception:
@@ -96,31 +102,54 @@ class StatisticSystem:
     def _read_today_counts_from_chat_history(self) -> Dict[str, int]:
         """chat_history.txt içinden sadece bugün tarihli satırlardan duygu say.
         Not: emotion_system JSON formatına göre kaba çıkarım yapar.
+
+        Dosya yalnızca sona eklenerek büyür; bu yüzden okunan son bayt konumu ve bugünün
+        sayaçları saklanır, her sorguda sadece yeni eklenen satırlar işlenir. Gün
+        değişince sayaçlar sıfırlanır (önceki satırların hepsi önceki günlere aittir);
+        dosya küçülürse (silme/döndürme) baştan okunur.
         """
-        counts: Dict[str, int] = {m: 0 for m in self.allowed_moods}
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        try:
-            if CHAT_HISTORY_FILE.exists():
-                for line in CHAT_HISTORY_FILE.read_text(encoding="utf-8").splitlines():
-                    if not line.strip():
-                        continue
-                    obj = json.loads(line)
-                    ts = str(obj.get("timestamp", ""))
-                    if not ts.startswith(today_str):
-                        continue
-                    resp = str(obj.get("response", ""))
-                    try:
-                        data = json.loads(resp)
-                    except Exception:
-                        data = None
-                    if isinstance(data, dict):
-                        for key in ["kullanici_ruh_hali", "ilk_ruh_hali", "ikinci_ruh_hali"]:
-                            val = str(data.get(key, "")).strip()
-                            if val in counts:
-                                counts[val] += 1
-        except Exception:
-            pass
-        return counts
+        today_str = time.strftime("%Y-%m-%d")
+        with self._history_lock:
+            if today_str != self._today:
+                self._today = today_str
+                self._today_counts = {m: 0 for m in self.allowed_moods}
+            try:
+                if CHAT_HISTORY_FILE.exists():
+                    if CHAT_HISTORY_FILE.stat().st_size < self._history_offset:
+                        self._history_offset = 0
+                        self._today_counts = {m: 0 for m in self.allowed_moods}
+                    with CHAT_HISTORY_FILE.open("rb") as f:
+                        f.seek(self._history_offset)
+                        chunk = f.read()
+                    # Yarım yazılmış son satır bir sonraki sorguya bırakılır
+                    end = chunk.rfind(b"\n") + 1
+                    self._history_offset += end
+                    self._count_history_lines(chunk[:end], today_str, self._today_counts)
+            except Exception:
+                pass
+            return dict(self._today_counts)
+
+    def _count_history_lines(self, chunk: bytes, today_str: str, counts: Dict[str, int]) -> None:
+        """Geçmiş satırlarından bugün tarihli olanların duygularını sayaçlara ekler.
+
+        Satırlar bayt olarak orjson ile çözülür; başka güne ait satırlar JSON'a hiç
+        girmeden önek kontrolüyle atlanır (orjson boşluksuz, eski json.dumps boşluklu yazar).
+        """
+        today = today_str.encode()
+        prefixes = (b'{"timestamp":"' + today, b'{"timestamp": "' + today)
+        for line in chunk.splitlines():
+            if not line.startswith(prefixes):
+                continue
+            try:
+                obj = orjson.loads(line)
+                data = orjson.loads(obj.get("response", ""))
+            except Exception:
+                continue
+            if isinstance(data, dict):
+                for key in ("kullanici_ruh_hali", "ilk_ruh_hali", "ikinci_ruh_hali"):
+                    val = str(data.get(key, "")).strip()
+                    if val in counts:
+                        counts[val] += 1
 
     def compute_stats(self, period: str = "all", emotion: Optional[str] = None) -> Dict[str, Any]:
         """İstatistik hesapla ve özet üret."""